@@ -0,0 +1,50 @@
+# microbenchmark of the state derivative of cfPhysics:
+# evaluations per second of the "reference" and "cached" kernels,
+# and check that both kernels produce bit-for-bit identical trajectories
+#
+# usage: python -m benchmarks.derivative [evaluations]
+
+import sys
+import time
+import numpy as np
+
+from cfSimulator.Physics import cfPhysics, kernels
+
+evaluations = 100000
+hover_pwm   = np.array([43000, 44000, 43000, 44000])
+
+def flyingState(kernel):
+	# physics object in flight with a non-trivial attitude
+	physics = cfPhysics(kernel=kernel)
+	physics.x[0:13] = [0.1, -0.2, 0.5, 0.3, -0.1, 0.05, 0.99, 0.05, -0.08, 0.1, 0.4, -0.3, 0.2]
+	return physics
+
+def evaluationsPerSecond(kernel, n):
+	physics = flyingState(kernel)
+	xu = np.concatenate((physics.x, physics.pwdToForcesMap(hover_pwm)))
+	start = time.perf_counter()
+	for _ in range(n):
+		physics.stateDerivative(0, xu)
+	return n/(time.perf_counter()-start)
+
+def trajectory(kernel, integrator, steps=2000):
+	physics = cfPhysics(kernel=kernel, integrator=integrator)
+	x = np.zeros((steps, physics.n_states))
+	for i in range(steps):
+		x[i] = physics.simulate((i+1)*0.001, hover_pwm)
+	return x
+
+if __name__ == "__main__":
+
+	if len(sys.argv) > 1:
+		evaluations = int(sys.argv[1])
+
+	rates = {}
+	for kernel in kernels:
+		rates[kernel] = evaluationsPerSecond(kernel, evaluations)
+		print("%-10s %10.0f derivative evaluations per second" % (kernel, rates[kernel]))
+	print("speedup of cached kernel: %.2fx" % (rates["cached"]/rates["reference"]))
+
+	for integrator in ["RK45", "RK4"]:
+		identical = np.array_equal(trajectory("reference", integrator), trajectory("cached", integrator))
+		print("%-5s trajectories bit-for-bit identical: %s" % (integrator, identical))
@@ -0,0 +1,58 @@
+# consistency and timing of the closed form (Rodrigues) attitude error
+# rotation of cfEKF against the scipy matrix exponential
+#
+# usage: python -m benchmarks.ekf_attitude [calls]
+
+import sys
+import time
+import copy
+import numpy as np
+
+from cfSimulator import cfSimulation, SimulationConfig
+from cfSimulator.StateEstimator import cfEKF, predDT
+from testCases.referenceGen import Reference
+
+calls = 20000
+
+def rotationError(n=10000):
+	# largest difference between the two rotations on random vectors
+	# with norms spanning from 1e-9 to 1 rad
+	rng = np.random.default_rng(0)
+	expm, rodrigues = cfEKF(9.81, "expm"), cfEKF(9.81, "rodrigues")
+	err = 0
+	for v in rng.standard_normal((n,3))*np.logspace(-9, 0, n)[:,None]:
+		err = max(err, np.max(np.abs(expm.expCross(v)-rodrigues.expCross(v))))
+	return err
+
+def flightTraces(method, trajectory="step", duration=4):
+	data = cfSimulation().run(Reference(trajectory), duration, silence=True, config=SimulationConfig(ekfAttitude=method))
+	return np.concatenate((data.est_pos, data.est_vel, data.est_eta, data.kal_err_fd))
+
+def timePerCall(method, n):
+	# time of predictionStep and finalize from a state with non-zero attitude error
+	est = cfEKF(9.81, method)
+	est.x[3:9] = [0.1, -0.2, 0.05, 0.01, -0.02, 0.005]
+	acc  = np.array([0.1, -0.1, 9.8])
+	gyro = np.array([0.2, -0.1, 0.05])
+	results = []
+	for step in [lambda e: e.predictionStep(acc, gyro, predDT), lambda e: e.finalize()]:
+		copies = [copy.deepcopy(est) for _ in range(n)]
+		start = time.perf_counter()
+		for e in copies:
+			step(e)
+		results.append((time.perf_counter()-start)/n)
+	return results
+
+if __name__ == "__main__":
+
+	if len(sys.argv) > 1:
+		calls = int(sys.argv[1])
+
+	print("max rotation difference on random vectors: %.2e" % rotationError())
+	expm, rodrigues = flightTraces("expm"), flightTraces("rodrigues")
+	print("max estimate/innovation difference on a 4 s step flight: %.2e" % np.max(np.abs(expm-rodrigues)))
+
+	timings = {method: timePerCall(method, calls) for method in ["expm", "rodrigues"]}
+	for i, name in enumerate(["predictionStep", "finalize"]):
+		print("%-15s expm %6.1f us   rodrigues %6.1f us   speedup %.1fx" % (name,\
+		      timings["expm"][i]*1e6, timings["rodrigues"][i]*1e6, timings["expm"][i]/timings["rodrigues"][i]))
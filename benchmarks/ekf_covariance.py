@@ -0,0 +1,47 @@
+# consistency and timing of the covariance updates of cfEKF
+# against the reference Joseph form
+#
+# usage: python -m benchmarks.ekf_covariance [calls]
+
+import sys
+import time
+import copy
+import numpy as np
+
+from cfSimulator import cfSimulation, SimulationConfig
+from cfSimulator.StateEstimator import cfEKF, covarianceUpdates
+from testCases.referenceGen import Reference
+
+calls = 20000
+
+def flightInnovations(method, trajectory="step", duration=4):
+	data = cfSimulation().run(Reference(trajectory), duration, silence=True, config=SimulationConfig(ekfCovariance=method))
+	return data.kal_err_fd
+
+def timePerCall(method, n):
+	# time of a flow measurement update and of the process noise update
+	est = cfEKF(9.81, covarianceUpdate=method)
+	est.x[0:6] = [0.1, -0.2, 0.5, 0.1, -0.05, 0.02]
+	H = np.array([0, 0, -1.5, 2.0, 0, 0, 0, 0, 0])
+	results = []
+	for step in [lambda e: e.scalarUpdate(0.3, H, e.flowStd), lambda e: e.addProcessNoise(0.001)]:
+		copies = [copy.deepcopy(est) for _ in range(n)]
+		start = time.perf_counter()
+		for e in copies:
+			step(e)
+		results.append((time.perf_counter()-start)/n)
+	return results
+
+if __name__ == "__main__":
+
+	if len(sys.argv) > 1:
+		calls = int(sys.argv[1])
+
+	reference = flightInnovations("joseph")
+	for method in covarianceUpdates[1:]:
+		print("%-6s max innovation difference on a 4 s step flight: %.2e" % (method,\
+		      np.max(np.abs(flightInnovations(method)-reference))))
+
+	for method in covarianceUpdates:
+		update, noise = timePerCall(method, calls)
+		print("%-6s scalarUpdate %6.1f us   addProcessNoise %6.1f us" % (method, update*1e6, noise*1e6))
@@ -0,0 +1,40 @@
+# speed of prefix sharing: the trajectories of testCases/referenceGen.py
+# all start with the same hover, which is simulated once and then forked
+#
+# usage: python -m benchmarks.forks [duration] [trajectory ...]
+
+import sys
+import time
+import numpy as np
+
+from cfSimulator import cfSimulation
+from testCases.referenceGen import Reference
+
+duration     = 4
+prefix       = 2 # hover time shared by all the trajectories
+trajectories = ["step", "zsinus", "zramp", "ysinus", "spiral"]
+
+if __name__ == "__main__":
+
+	if len(sys.argv) > 1:
+		duration = float(sys.argv[1])
+	if len(sys.argv) > 2:
+		trajectories = sys.argv[2:]
+	sim = cfSimulation()
+
+	# every flight from the start
+	start = time.perf_counter()
+	full = [sim.run(Reference(trajectory), duration, silence=True) for trajectory in trajectories]
+	full_time = time.perf_counter()-start
+
+	# hover simulated once, then continued with each trajectory
+	start = time.perf_counter()
+	state = sim.snapshot(Reference(trajectories[0]), prefix, duration, silence=True)
+	forks = [sim.run(Reference(trajectory), duration, silence=True, state=state) for trajectory in trajectories]
+	fork_time = time.perf_counter()-start
+
+	identical = all(np.array_equal(f.pos, d.pos[:,state.step:]) and np.array_equal(f.u, d.u[:,state.step:])\
+	                for f, d in zip(forks, full))
+	print("%d flights of %g s sharing %g s of hover" % (len(trajectories), duration, prefix))
+	print("from the start: %.2f s   forked: %.2f s   speedup %.2fx   continuations identical: %s" %\
+	      (full_time, fork_time, full_time/fork_time, identical))
@@ -0,0 +1,56 @@
+# accuracy and speed of the fixed-step integrators against the
+# adaptive RK45 reference, on the trajectories of testCases/referenceGen.py
+#
+# usage: python -m benchmarks.integrators [duration] [trajectory ...]
+
+import sys
+import time
+import numpy as np
+
+from cfSimulator import cfSimulation, SimulationConfig, Integration_Failed, Drone_Crash
+from testCases.referenceGen import Reference
+
+duration     = 10
+trajectories = ["step", "zsinus", "zramp", "xsinus", "ysinus", "circle", "spiral"]
+reference    = "RK45"
+candidates   = ["RK4", "semi-implicit"]
+
+def timedRun(trajectory, integrator, duration):
+	# returns no data if the flight did not complete
+	start = time.perf_counter()
+	try:
+		data = cfSimulation().run(Reference(trajectory), duration, silence=True,\
+		                          config=SimulationConfig(integrator=integrator))
+	except (Integration_Failed, Drone_Crash) as e:
+		data = None
+		print("%-11s %-15s flight failed: %s" % (trajectory, integrator, type(e).__name__))
+	return data, time.perf_counter()-start
+
+if __name__ == "__main__":
+
+	if len(sys.argv) > 1:
+		duration = float(sys.argv[1])
+	if len(sys.argv) > 2:
+		trajectories = sys.argv[2:]
+
+	print("trajectory  integrator      max pos err [m]  rms pos err [m]  max att err [rad]  time [s]  speedup")
+	total = {name: 0.0 for name in [reference]+candidates}
+	for trajectory in trajectories:
+		ref_data, ref_time = timedRun(trajectory, reference, duration)
+		if ref_data is None:
+			continue
+		total[reference] += ref_time
+		print("%-11s %-15s %15s  %15s  %17s  %8.2f  %7s" % (trajectory, reference, "-", "-", "-", ref_time, "1.0x"))
+		for integrator in candidates:
+			data, run_time = timedRun(trajectory, integrator, duration)
+			if data is None:
+				continue
+			total[integrator] += run_time
+			pos_err = np.linalg.norm(data.pos-ref_data.pos, axis=0)
+			att_err = np.max(np.abs(data.eta-ref_data.eta))
+			print("%-11s %-15s %15.2e  %15.2e  %17.2e  %8.2f  %6.1fx" % (trajectory, integrator,\
+			      np.max(pos_err), np.sqrt(np.mean(pos_err**2)), att_err, run_time, ref_time/run_time))
+
+	print("overall speedup (total wall time):")
+	for integrator in candidates:
+		print("  %-15s %.1fx" % (integrator, total[reference]/total[integrator]))
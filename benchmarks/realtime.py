@@ -0,0 +1,42 @@
+# whether the simulation loop sustains real time: a flight paced to the
+# wall clock, with latency of the steps and of their stages, deadline
+# misses and jitter
+#
+# usage: python -m benchmarks.realtime [speed] [duration] [option=value ...]
+#        (options of SimulationConfig, e.g. integrator=RK4 forcesTable=True)
+
+import ast
+import sys
+
+from cfSimulator import cfSimulation, SimulationConfig, RealTimeClock
+from testCases.referenceGen import Reference
+
+speed     = 1 # multiple of real time
+duration  = 2
+reference = "step"
+
+def parseOption(option):
+	name, value = option.split("=", 1)
+	try:
+		return name, ast.literal_eval(value)
+	except (ValueError, SyntaxError): # strings
+		return name, value
+
+if __name__ == "__main__":
+
+	if len(sys.argv) > 1:
+		speed = float(sys.argv[1])
+	if len(sys.argv) > 2:
+		duration = float(sys.argv[2])
+	config = SimulationConfig(**dict(parseOption(o) for o in sys.argv[3:]))
+
+	clock = RealTimeClock(speed)
+	cfSimulation().run(Reference(reference), duration, silence=True, config=config, clock=clock)
+	print(clock.report())
+
+	# latency histogram of the steps (bins with at least 1% of the steps)
+	edges, counts = clock.histogram("latency")
+	print("latency histogram:")
+	for k in range(len(counts)):
+		if counts[k] >= 0.01*counts.sum():
+			print("  %5.0f-%5.0f us %s %d" % (edges[k]*1e6, edges[k+1]*1e6, "#"*int(50*counts[k]/counts.max()), counts[k]))
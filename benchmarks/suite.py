@@ -0,0 +1,288 @@
+# benchmark suite of the simulator: microbenchmarks of the hot paths of
+# physics, controller, estimator, data handling and references, and end to
+# end flights of every reference with and without noise and Kalman filter.
+# Results are written to JSON and can be compared with a stored baseline
+#
+# usage: python -m benchmarks.suite run [--out results.json] [--only name ...] [--duration s] [--quick]
+#        python -m benchmarks.suite compare baseline.json results.json [--threshold 0.15]
+#        python -m benchmarks.suite run --compare baseline.json
+# compare exits with status 1 if any benchmark is slower than the baseline by more than threshold
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import scipy
+
+from cfSimulator import cfSimulation, SimulationConfig, FlightDataHandler, Integration_Failed, Drone_Crash
+from cfSimulator.utils.PID import PID
+from cfSimulator.utils.PIDBank import PIDBank
+from cfSimulator.utils.lp2Filter import lp2Filter
+from testCases.referenceGen import Reference, WaypointReference
+
+trajectories = ["step", "zsinus", "zramp", "xsinus", "ysinus", "circle", "spiral"]
+duration     = 2     # duration of the end to end flights [s]
+min_time     = 0.2   # minimum time of a repetition of a microbenchmark [s]
+repeats      = 5     # repetitions of a microbenchmark (the fastest is kept)
+threshold    = 0.15  # relative slowdown flagged as a regression
+
+#######################
+### MICROBENCHMARKS ###
+#######################
+
+def hoverState():
+	# physics, controller and estimator hovering at 0.5 m (trimmed, see cfSimulator/Trim.py)
+	state = cfSimulation().start(1, config=SimulationConfig(trimHeight=0.5))
+	return state.physics, state.ctrl, state.est
+
+def benchStateDerivative():
+	physics, ctrl, est = hoverState()
+	xu = np.concatenate((physics.x, physics.pwdToForcesMap(np.full(4, ctrl.T))))
+	return lambda: physics.stateDerivative(0, xu)
+
+def benchSimulate():
+	physics, ctrl, est = hoverState()
+	u = np.full(4, ctrl.T)
+	t = [physics.currentTime]
+	def step():
+		t[0] = t[0]+0.001
+		physics.simulate(t[0], u)
+	return step
+
+def benchForcesMap():
+	physics, ctrl, est = hoverState()
+	u = np.array([43000.0, 44000.0, 43000.0, 44000.0])
+	return lambda: physics.pwdToForcesMap(u)
+
+def benchCtrlCompute():
+	physics, ctrl, est = hoverState()
+	ref, pos, vel, eta, gyro = np.array([0.1, 0, 0.5]), np.array([0, 0, 0.5]), np.zeros(3), np.zeros(3), np.zeros(3)
+	return lambda: ctrl.ctrlCompute(ref, pos, vel, eta, gyro)
+
+def benchPID():
+	pid = PID(25.0, 1.0, 0.1, 0.01, True, 100, 20, 5000)
+	return lambda: pid.run(0.1, 0.05)
+
+def benchPIDBank():
+	pid = PIDBank([25.0, 25.0, 25.0], [1.0, 1.0, 15], [0.1, 0.1, 0.1], 0.01, True, 100, [20, 20, 20], [5000, 5000, 5000])
+	ref, measure = np.array([0.1, 0.1, 0.5]), np.array([0.05, 0.0, 0.45])
+	return lambda: pid.run(ref, measure)
+
+def benchLp2Filter():
+	lpf = lp2Filter(500, 20)
+	return lambda: lpf.filter(0.3)
+
+def benchRunEKF():
+	physics, ctrl, est = hoverState()
+	acc, gyro, pxCount, zrange = physics.readAcc(0), physics.readGyro(0), physics.readPixelcount(0, False), physics.readZRanging(0)
+	return lambda: est.runEKF(acc, gyro, pxCount, zrange)
+
+def benchScalarUpdate():
+	physics, ctrl, est = hoverState()
+	H = np.zeros(9)
+	H[2] = 1
+	return lambda: est.scalarUpdate(0.0, H, 0.01)
+
+def flightData(length=1.0):
+	# flight data of a short noiseless flight
+	return cfSimulation().run(Reference("step"), length, silence=True, config=SimulationConfig())
+
+# the data benchmarks write their files in a directory given by runSuite
+
+def benchSave(directory):
+	data = flightData()
+	data.data_directory = directory
+	return lambda: data.save("bench")
+
+def benchOpen(directory):
+	data = flightData()
+	data.data_directory = directory
+	data.save("bench-open")
+	location = os.path.join(directory, "bench-open")
+	return lambda: FlightDataHandler().open(location, silent=True)
+
+def benchSaveCsv(directory):
+	data = flightData()
+	location = os.path.join(directory, "bench.csv")
+	return lambda: data.save_csv(location)
+
+def benchRefGen():
+	refs = [Reference(trajectory) for trajectory in trajectories]
+	t = [0.0]
+	def generate():
+		t[0] = t[0]+0.001
+		for ref in refs:
+			ref.refGen(t[0])
+	return generate
+
+def benchRefGenVector():
+	# references of a chunk of 1000 steps, evaluated at once
+	refs = [Reference(trajectory) for trajectory in trajectories]
+	t = np.linspace(0, 10, 1000)
+	def generate():
+		for ref in refs:
+			ref.refGenVector(t)
+	return generate
+
+def benchWaypoints():
+	ref = WaypointReference(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "testCases", "waypoints.csv"))
+	t = np.linspace(0, 10, 1000)
+	return lambda: ref.refGenVector(t)
+
+# name -> function returning the callable to time
+micro = {"physics.stateDerivative" : benchStateDerivative,
+         "physics.simulate"        : benchSimulate,
+         "physics.pwdToForcesMap"  : benchForcesMap,
+         "controller.ctrlCompute"  : benchCtrlCompute,
+         "utils.PID.run"           : benchPID,
+         "utils.PIDBank.run"       : benchPIDBank,
+         "utils.lp2Filter.filter"  : benchLp2Filter,
+         "estimator.runEKF"        : benchRunEKF,
+         "estimator.scalarUpdate"  : benchScalarUpdate,
+         "data.save"               : benchSave,
+         "data.open"               : benchOpen,
+         "data.save_csv"           : benchSaveCsv,
+         "reference.refGen"        : benchRefGen,       # all the trajectories at one time
+         "reference.refGenVector"  : benchRefGenVector, # all the trajectories at 1000 times
+         "reference.waypoints"     : benchWaypoints}    # minimum snap spline at 1000 times
+
+def timeCall(f, min_time, repeats):
+	# seconds per call of f: calls per repetition are doubled until a
+	# repetition takes at least min_time, the fastest repetition is kept
+	calls = 1
+	while True:
+		start = time.perf_counter()
+		for _ in range(calls):
+			f()
+		elapsed = time.perf_counter()-start
+		if elapsed>=min_time:
+			break
+		calls = calls*2
+	times = [elapsed/calls]
+	for _ in range(repeats-1):
+		start = time.perf_counter()
+		for _ in range(calls):
+			f()
+		times.append((time.perf_counter()-start)/calls)
+	return {"time": min(times), "median": float(np.median(times)), "calls": calls, "repeats": repeats}
+
+############################
+### END TO END SCENARIOS ###
+############################
+
+def scenarioName(trajectory, noise, kalman):
+	return "flight.%s.noise%g.kf-%s" % (trajectory, noise, "on" if kalman else "off")
+
+scenarios = {scenarioName(trajectory, noise, kalman): (trajectory, noise, kalman)\
+             for trajectory in trajectories for noise in [0, 1] for kalman in [True, False]}
+
+def timeScenario(trajectory, noise, kalman, duration):
+	# wall time of a flight, flights that do not complete are timed until they stop
+	config = SimulationConfig(noise=noise, useKalmanFilter=kalman)
+	start  = time.perf_counter()
+	status = "ok"
+	try:
+		cfSimulation().run(Reference(trajectory), duration, silence=True, config=config)
+	except Integration_Failed:
+		status = "integration failed"
+	except Drone_Crash:
+		status = "crash"
+	elapsed = time.perf_counter()-start
+	return {"time": elapsed, "steps_per_second": int(duration/config.t_resolution)/elapsed, "status": status}
+
+###############
+### RESULTS ###
+###############
+
+def environment():
+	# versions and machine the results were measured on
+	try:
+		commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,\
+		                        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+	except OSError:
+		commit = ""
+	return {"date": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit, "python": platform.python_version(),\
+	        "numpy": np.__version__, "scipy": scipy.__version__, "machine": platform.machine(),\
+	        "processor": platform.processor(), "system": platform.platform(), "cpus": os.cpu_count()}
+
+def runSuite(only=None, duration=duration, min_time=min_time, repeats=repeats, silent=False):
+	# runs the benchmarks whose name contains one of the strings in only (default: all)
+	# output: dictionary with environment, microbenchmarks and scenarios
+	selected = lambda name: only is None or any(o in name for o in only)
+	results = {"environment": environment(), "settings": {"duration": duration, "min_time": min_time,\
+	           "repeats": repeats}, "micro": {}, "scenarios": {}}
+	with tempfile.TemporaryDirectory() as directory: # files of the data benchmarks, removed at the end
+		for name, setup in micro.items():
+			if selected(name):
+				bench = setup(directory) if name.startswith("data.") else setup()
+				results["micro"][name] = timeCall(bench, min_time, repeats)
+				if not(silent):
+					print("%-40s %12.2f us per call" % (name, 1e6*results["micro"][name]["time"]))
+	for name, (trajectory, noise, kalman) in scenarios.items():
+		if selected(name):
+			results["scenarios"][name] = timeScenario(trajectory, noise, kalman, duration)
+			if not(silent):
+				r = results["scenarios"][name]
+				print("%-40s %12.3f s (%.0f steps/s) %s" % (name, r["time"], r["steps_per_second"], r["status"]))
+	return results
+
+def compare(baseline, results, threshold=threshold):
+	# benchmarks of both results with their time ratio (results/baseline)
+	# output: list of (name, baseline time, time, ratio, regression flag)
+	rows = []
+	for group in ["micro", "scenarios"]:
+		for name, r in results[group].items():
+			if name in baseline[group]:
+				ratio = r["time"]/baseline[group][name]["time"]
+				rows.append((name, baseline[group][name]["time"], r["time"], ratio, ratio>1+threshold))
+	return rows
+
+def printComparison(rows, threshold, baseline, results):
+	if baseline.get("settings")!=results.get("settings"):
+		print("NOTE: settings differ from the baseline: %s vs %s" % (baseline.get("settings"), results.get("settings")))
+	for name, base, current, ratio, regression in rows:
+		print("%-40s %12.6f s %12.6f s %7.2fx %s" % (name, base, current, ratio, "REGRESSION" if regression else ""))
+	regressions = sum(r[4] for r in rows)
+	print("%d benchmarks compared, %d slower than the baseline by more than %.0f%%" % (len(rows), regressions, 100*threshold))
+	return regressions
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="benchmark suite of the simulator")
+	commands = parser.add_subparsers(dest="command", required=True)
+	run = commands.add_parser("run", help="run the benchmarks")
+	run.add_argument("--out", default=None, help="JSON file where the results are stored")
+	run.add_argument("--only", nargs="+", default=None, help="run only the benchmarks whose name contains one of these")
+	run.add_argument("--duration", type=float, default=duration, help="duration of the flights [s]")
+	run.add_argument("--quick", action="store_true", help="short repetitions and flights, for a rough check")
+	run.add_argument("--compare", default=None, help="baseline JSON file the results are compared with")
+	run.add_argument("--threshold", type=float, default=threshold, help="relative slowdown flagged as a regression")
+	cmp = commands.add_parser("compare", help="compare results with a baseline")
+	cmp.add_argument("baseline", help="JSON file of the baseline")
+	cmp.add_argument("results", help="JSON file of the results")
+	cmp.add_argument("--threshold", type=float, default=threshold, help="relative slowdown flagged as a regression")
+	args = parser.parse_args()
+
+	if args.command == "run":
+		if args.quick:
+			results = runSuite(args.only, min(args.duration, 0.5), 0.02, 3)
+		else:
+			results = runSuite(args.only, args.duration)
+		if args.out is not None:
+			with open(args.out, "w") as f:
+				json.dump(results, f, indent=1)
+		if args.compare is None:
+			sys.exit(0)
+		with open(args.compare) as f:
+			baseline = json.load(f)
+	else:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		with open(args.results) as f:
+			results = json.load(f)
+	sys.exit(1 if printComparison(compare(baseline, results, args.threshold), args.threshold, baseline, results) else 0)
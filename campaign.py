@@ -0,0 +1,62 @@
+import argparse
+import pickle as pk
+import time
+
+from cfSimulator.Campaign import campaignGrid, runCampaign, flightName, summarize
+from testCases.referenceGen import Reference
+
+# runs a grid of test flights on all the cores, for example:
+#   python campaign.py --references step circle --seeds 1 2 3 4 --noise 0 1 --kalman on off
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description="Monte Carlo campaign of test flights")
+	parser.add_argument("--references", nargs="+", default=["step"], help="reference types")
+	parser.add_argument("--durations", nargs="+", type=float, default=[10], help="flight durations [s]")
+	parser.add_argument("--seeds", nargs="+", type=int, default=[1], help="noise seeds")
+	parser.add_argument("--noise", nargs="+", type=float, default=[0], help="measurement noise gains")
+	parser.add_argument("--kalman", nargs="+", choices=["on", "off"], default=["on"], help="estimator feedback")
+	parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+	parser.add_argument("--save", default=None, help="file where the results are stored")
+	parser.add_argument("--cache", default=None, help="directory of the cache of flight data (default: no cache)")
+	parser.add_argument("--abort-tracking", type=float, default=None, help="abort flights with a larger tracking error [m]")
+	parser.add_argument("--abort-tilt", type=float, default=None, help="abort flights with a larger roll or pitch [deg]")
+	parser.add_argument("--abort-delay", type=float, default=0, help="time before the abort criteria are checked [s]")
+	parser.add_argument("--abort-nan", action="store_true", help="abort flights with non finite states, inputs or estimates")
+	args = parser.parse_args()
+
+	# abort criteria of the flights (see cfSimulator/Abort.py)
+	settings = {"abortTracking": args.abort_tracking, "abortTilt": args.abort_tilt, "abortDelay": args.abort_delay}
+	if args.abort_nan:
+		settings["abortNaN"] = True
+	flights = campaignGrid([Reference(r) for r in args.references], args.durations, args.seeds,\
+	                       args.noise, [k=="on" for k in args.kalman], settings)
+
+	# run the flights and print their results as they complete
+	start_campaign = time.perf_counter()
+	results = []
+	for result in runCampaign(flights, args.workers, cache_directory=args.cache):
+		results.append(result)
+		status = result["status"] if result["abort"] is None else result["status"]+" by "+result["abort"]
+		line = "[%d/%d] %s: %s (%.1f s%s)" % (len(results), len(flights), flightName(result["flight"]),\
+		                                      status, result["time"], ", cached" if result["cached"] else "")
+		if result["metrics"] is not None:
+			line = line + " tracking rms %.4f m" % result["metrics"]["track_rms"]
+		print(line)
+		if result["error"] is not None:
+			print(result["error"])
+	end_campaign = time.perf_counter()
+
+	# aggregated summary
+	print("This campaign took " + str(end_campaign-start_campaign) + " seconds" +\
+	      " (%.1f s of flights)" % sum(r["time"] for r in results))
+	for (reference, noise, kalman), entry in sorted(summarize(results).items()):
+		print("%-8s noise=%-4g kf=%-3s ok %d/%d, aborted %d, crashes %d, integration failures %d, errors %d,"\
+		      " tracking rms mean %.4f worst %.4f m, estimate rms mean %.4f m" %\
+		      (reference, noise, "on" if kalman else "off", entry["ok"], entry["flights"], entry["aborted"], entry["crash"],\
+		       entry["integration failed"], entry["error"], entry["track_rms_mean"],\
+		       entry["track_rms_worst"], entry["est_rms_mean"]))
+
+	if args.save is not None:
+		with open(args.save, "wb") as f:
+			pk.dump(results, f, protocol=pk.HIGHEST_PROTOCOL)
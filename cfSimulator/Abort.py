@@ -0,0 +1,60 @@
+# criteria stopping a run as soon as the flight is hopeless
+import numpy as np
+
+'''
+	Abort criteria of a run, taken from the abort options of its
+	SimulationConfig (unset options are not checked). They are checked
+	after every step (from abortDelay seconds after the start of the run,
+	e.g., to let the drone take off), and the first one that trips stops
+	the run:
+	 * "nan"            : non finite state, input or estimate (checked from the start)
+	 * "tracking error" : distance between position and reference above abortTracking [m]
+	 * "attitude"       : roll or pitch above abortTilt [deg]
+	 * "covariance"     : a variance of the estimator above abortCovariance (the horizontal
+	                      position is not observable and its variance stays at the saturation
+	                      of the EKF, 100, so only height, velocity and attitude are checked)
+	 * "ground impact"  : ground contact with a downward speed above abortImpact [m/s]
+'''
+class AbortCheck():
+
+	def __init__(self, config):
+		self.nan        = config.abortNaN
+		self.tracking   = config.abortTracking
+		self.tilt       = None if config.abortTilt is None else config.abortTilt*np.pi/180
+		self.covariance = config.abortCovariance
+		self.impact     = config.abortImpact
+		self.start      = config.t_init+config.abortDelay
+
+	def check(self, t, x, u, eta, set_pt, x_est, est):
+		# input : t: time of the step
+		#         x, u, eta: physical state, inputs and euler angles of the step
+		#         set_pt, x_est: reference and estimated state of the step
+		#         est: state estimator object
+		# output: reason of the abort (see above) and value that tripped it,
+		#         or None if the run can go on
+		if self.nan and not(np.isfinite(x).all() and np.isfinite(u).all() and np.isfinite(x_est).all()):
+			return "nan", float("nan")
+		if t<self.start:
+			return None
+		if self.tracking is not None:
+			error = np.sqrt(np.sum((x[0:3]-set_pt)**2))
+			if error>self.tracking:
+				return "tracking error", float(error)
+		if self.tilt is not None:
+			tilt = max(abs(eta[0]), abs(eta[1]))
+			if tilt>self.tilt:
+				return "attitude", float(tilt*180/np.pi)
+		if self.covariance is not None:
+			variance = np.max(np.diagonal(est.P)[2:9])
+			if variance>self.covariance:
+				return "covariance", float(variance)
+		if self.impact is not None and x[2]<0.001 and -x[5]>self.impact: # ground contact as in cfPhysics
+			return "ground impact", float(-x[5])
+		return None
+
+def abortCheck(config):
+	# AbortCheck of the configuration, None if no criterion is set
+	if config.abortNaN or any(v is not None for v in [config.abortTracking, config.abortTilt,\
+	                                                   config.abortCovariance, config.abortImpact]):
+		return AbortCheck(config)
+	return None
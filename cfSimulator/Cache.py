@@ -0,0 +1,163 @@
+# on-disk cache of the results of simulation runs
+import glob
+import hashlib
+import inspect
+import os
+import pickle as pk
+import tempfile
+import numpy as np
+try:
+	import fcntl # file locks (not available on Windows)
+except ImportError:
+	fcntl = None
+
+from .Simulation import cfSimulation, currentConfig
+
+cache_directory = "flightdata/cache"
+cache_max_bytes = 2**30 # 1 GB
+
+'''
+	Content addressed cache of flight data: a run is stored in a file named
+	by the hash of everything the result depends on (reference, duration,
+	seed, SimulationConfig and source code of the simulator), so that
+	identical runs are simulated only once. The least recently used runs
+	are removed when the cache grows beyond its maximum size.
+	Files are written atomically and eviction is serialized with a file
+	lock, so a cache directory can be shared by several processes
+'''
+class RunCache():
+
+	def __init__(self, directory=cache_directory, max_bytes=cache_max_bytes):
+		self.directory = directory
+		self.max_bytes = max_bytes
+		os.makedirs(self.directory, exist_ok=True)
+		# statistics of this object
+		self.hits      = 0
+		self.misses    = 0
+		self.stores    = 0
+		self.evictions = 0
+
+	###########################
+	### KEYS OF THE RESULTS ###
+	###########################
+
+	def key(self, ref, t_final, seed=1, config=None):
+		# hash identifying a run (config=None stands for the module variables of Simulation),
+		# the reference generator object must be picklable
+		config = currentConfig() if config is None else config
+		if isinstance(seed, np.random.SeedSequence): # the noise depends only on these (see utils.sensorSeeds),
+			seed = (seed.entropy, seed.spawn_key, seed.pool_size) # not on the children already spawned
+		h = hashlib.sha256()
+		h.update(sourceHash(type(ref)).encode())
+		h.update(pk.dumps((ref, float(t_final), seed, sorted(config.asdict().items())), protocol=4))
+		return h.hexdigest()
+
+	def path(self, key):
+		return os.path.join(self.directory, key+".pkl")
+
+	####################
+	### CACHE ACCESS ###
+	####################
+
+	def get(self, key):
+		# returns the stored flight data, or None if the run is not in the cache
+		try:
+			with open(self.path(key), "rb") as f:
+				data = pk.load(f)
+		except (FileNotFoundError, EOFError, pk.UnpicklingError):
+			self.misses = self.misses+1
+			return None
+		try:
+			os.utime(self.path(key)) # last access time, used for the eviction
+		except FileNotFoundError: # evicted by another process in the meantime
+			pass
+		self.hits = self.hits+1
+		return data
+
+	def put(self, key, data):
+		# stores the flight data (written to a temporary file and then renamed)
+		fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+		try:
+			with os.fdopen(fd, "wb") as f:
+				pk.dump(data, f, protocol=pk.HIGHEST_PROTOCOL)
+			os.replace(tmp, self.path(key))
+		except BaseException:
+			os.remove(tmp)
+			raise
+		self.stores = self.stores+1
+		self.evict()
+
+	def run(self, ref, t_final, seed=1, config=None, silence=True):
+		# same as cfSimulation().run, unless the run is in the cache
+		key  = self.key(ref, t_final, seed, config)
+		data = self.get(key)
+		if data is None:
+			data = cfSimulation().run(ref, t_final, silence=silence, seed=seed, config=config)
+			self.put(key, data)
+		return data
+
+	################
+	### EVICTION ###
+	################
+
+	def entries(self):
+		# stored runs as (last access time, size, path), least recently used first
+		entries = []
+		for path in glob.glob(os.path.join(self.directory, "*.pkl")):
+			try:
+				st = os.stat(path)
+			except FileNotFoundError: # removed by another process
+				continue
+			entries.append((st.st_mtime, st.st_size, path))
+		return sorted(entries)
+
+	def evict(self):
+		# removes the least recently used runs until the cache fits in max_bytes
+		with open(os.path.join(self.directory, ".lock"), "w") as lock:
+			if fcntl is not None:
+				fcntl.flock(lock, fcntl.LOCK_EX)
+			entries = self.entries()
+			size = sum(e[1] for e in entries)
+			for _, entry_size, path in entries:
+				if size<=self.max_bytes:
+					break
+				try:
+					os.remove(path)
+					self.evictions = self.evictions+1
+				except FileNotFoundError:
+					pass
+				size = size-entry_size
+
+	def clear(self):
+		for _, _, path in self.entries():
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+
+	def stats(self):
+		# hits, misses, stores and evictions of this object, and content of the cache
+		entries = self.entries()
+		return {"hits": self.hits, "misses": self.misses, "stores": self.stores,\
+		        "evictions": self.evictions, "entries": len(entries),\
+		        "bytes": sum(e[1] for e in entries), "max_bytes": self.max_bytes}
+
+source_hashes = {}
+
+def sourceHash(ref_class):
+	# hash of the source code of the simulator package and of the module of the
+	# reference generator, computed once per process
+	try:
+		module = inspect.getsourcefile(ref_class)
+	except TypeError: # class without a source file
+		module = None
+	if not(module in source_hashes):
+		files = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "**", "*.py"), recursive=True))
+		if module is not None:
+			files.append(module)
+		h = hashlib.sha256()
+		for name in files:
+			with open(name, "rb") as f:
+				h.update(f.read())
+		source_hashes[module] = h.hexdigest()
+	return source_hashes[module]
@@ -0,0 +1,120 @@
+# functions running campaigns of independent test flights on a pool of processes
+import itertools
+import os
+import time
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .Simulation import cfSimulation
+from .Config import SimulationConfig
+from .Cache import RunCache
+from .Physics import Integration_Failed, Drone_Crash
+
+'''
+	A campaign is a list of flights, each described by a dictionary with keys:
+	 * reference : reference generator object (as accepted by cfSimulation.run)
+	 * duration  : duration of the flight in seconds
+	 * seed      : seed of the measurement noise
+	 * noise     : measurement noise gain (Simulation.noise)
+	 * kalman    : if true the EKF estimate is used for feedback (Simulation.useKalmanFilter)
+	 * settings  : optional dictionary of other SimulationConfig options (e.g., {"integrator": "RK4"})
+	 * state     : optional SimulationState the flight continues from (see campaignForks)
+	The flights run in parallel and their results are returned as they complete
+'''
+
+def campaignGrid(references, durations, seeds, noises=(0,), kalman=(True,), settings=None):
+	# list of flights with all the combinations of the given values
+	return [{"reference": r, "duration": d, "seed": s, "noise": n, "kalman": k,\
+	         "settings": {} if settings is None else settings}\
+	        for r, d, s, n, k in itertools.product(references, durations, seeds, noises, kalman)]
+
+def campaignForks(state, references, t_final):
+	# list of flights continuing a snapshot of a run (cfSimulation.snapshot)
+	# with different references, until time t_final
+	return [{"reference": r, "duration": t_final, "seed": None, "noise": state.config.noise,\
+	         "kalman": state.config.useKalmanFilter, "state": state} for r in references]
+
+def flightMetrics(data):
+	# summary of a flight: rms and max tracking error, rms estimation error
+	# (from the summary of the run if the traces were not recorded)
+	if data.pos is None or data.set_pt is None or data.est_pos is None:
+		return {metric: data.summary[metric] for metric in ["track_rms", "track_max", "est_rms"]}
+	track = np.sqrt(np.sum((data.pos-data.set_pt)**2, axis=0))
+	est   = np.sqrt(np.sum((data.est_pos-data.pos)**2, axis=0))
+	return {"track_rms": float(np.sqrt(np.mean(track**2))),\
+	        "track_max": float(np.max(track)),\
+	        "est_rms"  : float(np.sqrt(np.mean(est**2)))}
+
+def runFlight(flight, keep_data=False, cache_directory=None):
+	# runs one flight of a campaign (in a worker process), taking the
+	# flight data from the cache in cache_directory if it is given
+	# output: dictionary with the flight, its status ("ok", "aborted", "integration
+	#         failed", "crash" or "error"), wall time, metrics, (optionally) flight
+	#         data, whether the flight data came from the cache, and the reason of
+	#         the abort (see cfSimulator/Abort.py)
+	result = {"flight": flight, "status": "ok", "metrics": None, "data": None, "error": None, "cached": False,\
+	          "abort": None}
+	start = time.perf_counter()
+	try:
+		config = SimulationConfig(**dict(flight.get("settings", {}), noise=flight["noise"], useKalmanFilter=flight["kalman"]))
+		if flight.get("state") is not None: # continuation of a snapshot
+			data = cfSimulation().run(flight["reference"], flight["duration"], silence=True, state=flight["state"])
+		elif cache_directory is None:
+			data = cfSimulation().run(flight["reference"], flight["duration"], silence=True, seed=flight["seed"], config=config)
+		else:
+			cache = RunCache(cache_directory)
+			data  = cache.run(flight["reference"], flight["duration"], seed=flight["seed"], config=config)
+			result["cached"] = cache.hits>0
+		result["metrics"] = flightMetrics(data)
+		if data.abortReason is not None: # stopped by an abort criterion of the settings
+			result["status"] = "aborted"
+			result["abort"]  = data.abortReason
+		if keep_data:
+			result["data"] = data
+	except Integration_Failed:
+		result["status"] = "integration failed"
+	except Drone_Crash:
+		result["status"] = "crash"
+	except (Exception, SystemExit): # also invalid settings (TypeError or sys.exit)
+		result["status"] = "error"
+		result["error"]  = traceback.format_exc()
+	result["time"] = time.perf_counter()-start
+	return result
+
+def runCampaign(flights, workers=None, keep_data=False, cache_directory=None):
+	# generator running the flights on a pool of processes (all the cores by default),
+	# results are yielded as soon as they are available, in completion order
+	workers = os.cpu_count() if workers is None else workers
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		futures = [pool.submit(runFlight, flight, keep_data, cache_directory) for flight in flights]
+		for future in as_completed(futures):
+			yield future.result()
+
+def flightName(flight):
+	# short description of a flight
+	reference = getattr(flight["reference"], "trajectoryType", "arbitrary")
+	return "%s %gs seed=%s noise=%g kf=%s" % (reference, flight["duration"], flight["seed"],\
+	                                         flight["noise"], "on" if flight["kalman"] else "off")
+
+def summarize(results):
+	# aggregated summary of the results, grouped by reference, noise and estimator
+	# output: dictionary from (reference, noise, kalman) to counts of each status,
+	#         mean and worst metrics of the successful flights, and total wall time
+	groups = {}
+	for result in results:
+		flight = result["flight"]
+		key = (getattr(flight["reference"], "trajectoryType", "arbitrary"), flight["noise"], flight["kalman"])
+		groups.setdefault(key, []).append(result)
+	summary = {}
+	for key, group in groups.items():
+		ok = [r["metrics"] for r in group if r["status"]=="ok"]
+		entry = {"flights": len(group), "time": sum(r["time"] for r in group)}
+		for status in ["ok", "aborted", "integration failed", "crash", "error"]:
+			entry[status] = sum(r["status"]==status for r in group)
+		for metric in ["track_rms", "track_max", "est_rms"]:
+			values = [m[metric] for m in ok]
+			entry[metric+"_mean"]  = float(np.mean(values)) if values else float("nan")
+			entry[metric+"_worst"] = float(np.max(values)) if values else float("nan")
+		summary[key] = entry
+	return summary
@@ -0,0 +1,56 @@
+# configuration of a simulation run
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from . import Controller
+from . import StateEstimator
+from .Recording import RecordingSpec
+
+'''
+	Immutable (and hashable) set of simulation options, passed to
+	cfSimulation.run and from it to the physics, controller and estimator.
+	A copy with different options is obtained with config.replace(...)
+'''
+@dataclass(frozen=True)
+class SimulationConfig():
+	# simulation parameters
+	t_init          : float = 0
+	t_resolution    : float = 0.001    # simulation step, controller and EKF tick at 1/t_resolution
+	noise           : float = 0        # if non-zero includes measurement noise with given gain
+	useKalmanFilter : bool  = True     # if true the KF is used for feedback
+	quantisation    : bool  = False    # if false removes quantisation from flow data
+	trimHeight      : Optional[float] = None # if given, the run starts hovering at this height [m] (see Trim.py)
+	recording       : Optional[RecordingSpec] = None # signals kept by cfSimulation.run and their rates (default: all, every step)
+	# physics
+	integrator      : str   = "RK45"   # physics integration method: "RK45", "RK4" or "semi-implicit"
+	kernel          : str   = "reference" # physics state derivative implementation: "reference" or "cached"
+	zoh             : bool  = False    # if true inputs held by the controller are integrated in one solver call
+	forcesTable     : bool  = False    # if true PWM commands are mapped to forces with a precomputed table
+	# controller rates [Hz]
+	rate_attitude   : float = Controller.rate_attitude
+	rate_position   : float = Controller.rate_position
+	# state estimator
+	ekfAttitude     : str   = "expm"   # EKF attitude error rotation: "expm" or "rodrigues"
+	ekfCovariance   : str   = "joseph" # EKF covariance update of the measurements: "joseph", "rank1" or "sqrt"
+	predictionRate  : float = StateEstimator.predictionRate # [Hz]
+	zrangingRate    : float = StateEstimator.zrangingRate   # [Hz]
+	flowRate        : float = StateEstimator.flowRate       # [Hz]
+	# abort criteria, unset ones are not checked (see Abort.py)
+	abortTracking   : Optional[float] = None # position tracking error [m]
+	abortTilt       : Optional[float] = None # roll or pitch angle [deg]
+	abortCovariance : Optional[float] = None # variance of an estimator state
+	abortNaN        : bool  = False    # if true non finite states, inputs and estimates abort the run
+	abortImpact     : Optional[float] = None # downward speed at ground contact [m/s]
+	abortDelay      : float = 0        # time after t_init before the criteria (except NaN) are checked [s]
+
+	@property
+	def mainRate(self):
+		# rate of the controller and EKF ticks [Hz]
+		return round(1/self.t_resolution)
+
+	def replace(self, **changes):
+		# copy of the configuration with some of the options changed
+		return SimulationConfig(**dict(self.asdict(), **changes))
+
+	def asdict(self):
+		return {f.name: getattr(self, f.name) for f in fields(self)}
@@ -1,6 +1,6 @@
 # class implementing the PID controller of the Crazyflie
 import numpy as np
-from .utils import PID
+from .utils import PIDBank
 
 '''
 	controller "macros"
@@ -12,9 +12,9 @@ rate_position = 100
 posDT = 1/rate_position
 attDT = 1/rate_attitude
 
-def rateDo(rate, tick):
+def rateDo(rate, tick, main=rate_main):
 	#utility function to trigger cascaded control loops at different rates
-	return not( tick % (rate_main/rate))
+	return not( tick % (main/rate))
 
 # low pass filters on derivative action
 pos_lpf_enable     = True
@@ -32,12 +32,28 @@ thrust_max = 65535
 roll_limit  = 20   # degrees
 pitch_limit = 20   # degrees
 
+# PID gains (kp, ki, kd), integral clamps and derivative filter cutoffs
+# of the cascaded loops, each with one entry per axis
+pid_gains = {"pos"  : ([2.0, 2.0, 2.0], [0, 0, 0.5], [0, 0, 0]),        # x, y, z
+             "vel"  : ([25.0, 25.0, 25.0], [1.0, 1.0, 15], [0, 0, 0]),  # vx, vy, vz
+             "att"  : ([6, 6, 6], [3, 3, 1], [0, 0, 0.35]),             # phi, theta, psi
+             "rate" : ([250, 250, 120], [500, 500, 16.7], [2.5, 2.5, 0])} # phi, theta, psi rates
+pid_Iclamps = {"pos"  : [5000, 5000, 5000],
+               "vel"  : [5000, 5000, 5000],
+               "att"  : [20, 20, 360],
+               "rate" : [33.3, 33.3, 166.7]}
+pid_cutoffs = {"pos"  : [pos_filter_cutoff, pos_filter_cutoff, posZ_filter_cutoff],
+               "vel"  : [vel_filter_cutoff, vel_filter_cutoff, velZ_filter_cutoff],
+               "att"  : [att_filter_cutoff, att_filter_cutoff, att_filter_cutoff],
+               "rate" : [attRate_filter_cutoff, attRate_filter_cutoff, attRate_filter_cutoff]}
+
 '''
 	Actual controller class
 '''
 class cfPIDController():
 	
-	def __init__(self, config, b, I, m, g, k, l):
+	def __init__(self, config, b, I, m, g, k, l, simConfig=None):
+		# simConfig: SimulationConfig with the loop rates (default: module macros)
 		#drone parameters
 		self.b = b
 		self.I = I
@@ -47,26 +63,34 @@ class cfPIDController():
 		self.l = l
 		self.config = config
 
+		# execution of different control loops
+		if simConfig is None:
+			self.rate_main, self.rate_attitude, self.rate_position = rate_main, rate_attitude, rate_position
+		else:
+			self.rate_main     = simConfig.mainRate
+			self.rate_attitude = simConfig.rate_attitude
+			self.rate_position = simConfig.rate_position
+		posDT = 1/self.rate_position
+		attDT = 1/self.rate_attitude
+
 		# controller states
 		self.tick = 1
 		self.T    = 0
 		self.tau  = np.array([0,0,0])
 		self.etaDesired = np.array([0,0,0])
 
-		# PID controllers - position
-		self.xPID  = PID(2.0,0,0,posDT,pos_lpf_enable,rate_position,pos_filter_cutoff,5000)
-		self.yPID  = PID(2.0,0,0,posDT,pos_lpf_enable,rate_position,pos_filter_cutoff,5000)
-		self.zPID  = PID(2.0,0.5,0,posDT,pos_lpf_enable,rate_position,posZ_filter_cutoff,5000)
-		self.vxPID = PID(25.0,1.0,0,posDT,pos_lpf_enable,rate_position,vel_filter_cutoff,5000)
-		self.vyPID = PID(25.0,1.0,0,posDT,pos_lpf_enable,rate_position,vel_filter_cutoff,5000)
-		self.vzPID = PID(25.0,15 ,0,posDT,pos_lpf_enable,rate_position,velZ_filter_cutoff,5000)
-		# PID controllers - attitude
-		self.phiPID    = PID(6,3,0,attDT,att_lpf_enable,rate_attitude,att_filter_cutoff,20)
-		self.thetaPID  = PID(6,3,0,attDT,att_lpf_enable,rate_attitude,att_filter_cutoff,20)
-		self.psiPID    = PID(6,1,0.35,attDT,att_lpf_enable,rate_attitude,att_filter_cutoff,360)
-		self.phidPID   = PID(250,500,2.5,attDT,att_lpf_enable,rate_attitude,attRate_filter_cutoff,33.3)
-		self.thetadPID = PID(250,500,2.5,attDT,att_lpf_enable,rate_attitude,attRate_filter_cutoff,33.3)
-		self.psidPID   = PID(120,16.7,0,attDT,att_lpf_enable,rate_attitude,attRate_filter_cutoff,166.7)
+		# PID controllers - position (x, y, z)
+		self.posPID  = PIDBank(*pid_gains["pos"], posDT, pos_lpf_enable, self.rate_position,\
+		                       pid_cutoffs["pos"], pid_Iclamps["pos"])
+		# PID controllers - velocity (vx, vy, vz)
+		self.velPID  = PIDBank(*pid_gains["vel"], posDT, pos_lpf_enable, self.rate_position,\
+		                       pid_cutoffs["vel"], pid_Iclamps["vel"])
+		# PID controllers - attitude (phi, theta, psi)
+		self.attPID  = PIDBank(*pid_gains["att"], attDT, att_lpf_enable, self.rate_attitude,\
+		                       pid_cutoffs["att"], pid_Iclamps["att"])
+		# PID controllers - attitude rate (phi, theta, psi)
+		self.ratePID = PIDBank(*pid_gains["rate"], attDT, att_lpf_enable, self.rate_attitude,\
+		                       pid_cutoffs["rate"], pid_Iclamps["rate"])
 		
 	#############################
 	### TORQUE -> PWM MAPPING ###
@@ -89,34 +113,33 @@ class cfPIDController():
 
 	def positionCtrl(self, ref, pos, vel, eta):
 		# position controller: from desired and estimated position to desired attitude
-		v_ref = np.array([0.0,0.0,0.0])
-		v_ref[0] = self.xPID.run(ref[0], pos[0])
-		v_ref[1] = self.yPID.run(ref[1], pos[1])
-		v_ref[2] = self.zPID.run(ref[2], pos[2])
+		v_ref = self.posPID.run(ref, pos)
 		# NOTE: firmware inverts the naming of roll and pitch for -Raw variables
-		pitchRaw = self.vxPID.run(v_ref[0], vel[0])
-		rollRaw  = self.vyPID.run(v_ref[1], vel[1])
+		pitchRaw, rollRaw, thrust = self.velPID.run(v_ref, vel)
 		roll  = - rollRaw  * np.cos(eta[2]*np.pi/180.0) - pitchRaw * np.sin(eta[2]*np.pi/180.0)
 		pitch = - pitchRaw * np.cos(eta[2]*np.pi/180.0) + rollRaw  * np.sin(eta[2]*np.pi/180.0)
 		roll  = np.clip(roll ,-roll_limit,roll_limit)
 		pitch = np.clip(pitch,-pitch_limit,pitch_limit)
-		thrust = self.vzPID.run(v_ref[2], vel[2])
 		thrustScale = 1000
 		thrustBase   = 36000
 		thrust = np.clip(thrust*thrustScale+thrustBase, thrust_min, thrust_max)
 		return thrust, np.array([roll, pitch, 0])
 
 	def attitudeCtrl(self, etaDesired, eta, etadot):
-		etadot_ref = np.array([0.0,0.0,0.0])
-		etadot_ref[0] = self.phiPID.run(etaDesired[0], eta[0])
-		etadot_ref[1] = self.thetaPID.run(etaDesired[1], eta[1])
-		etadot_ref[2] = self.psiPID.run(etaDesired[2], eta[2])
-		tau = np.array([0,0,0])
-		tau[0] = self.phidPID.run(etadot_ref[0], etadot[0])
-		tau[1] = self.thetadPID.run(etadot_ref[1], etadot[1])
-		tau[2] = self.psidPID.run(etadot_ref[2], etadot[2])
+		etadot_ref = self.attPID.run(etaDesired, eta)
+		# torques are integers as in the firmware
+		tau = self.ratePID.run(etadot_ref, etadot).astype(int)
 		return tau
 
+	def heldTicks(self):
+		# number of upcoming calls to ctrlCompute that will return
+		# the same PWM values of the last call (no control loop runs)
+		n = 0
+		while not(rateDo(self.rate_position, self.tick+n, self.rate_main)) and\
+		      not(rateDo(self.rate_attitude, self.tick+n, self.rate_main)):
+			n = n+1
+		return n
+
 	def ctrlCompute(self, pos_r, pos, vel, eta, gyro):
 		# main controller function 
 		# note that it gets attitude in quaternions from x but also euler angles from eta
@@ -128,10 +151,10 @@ class cfPIDController():
 		eta_fw    =  (eta*180.0/np.pi)*np.array([1,-1,-1])
 		etadot_fw = (gyro*180.0/np.pi)*np.array([1,-1,-1])
 		# position control
-		if rateDo(rate_position, self.tick):
+		if rateDo(self.rate_position, self.tick, self.rate_main):
 			self.T, self.etaDesired = self.positionCtrl(pos_r, pos, vel, eta_fw)
 		# attitude control
-		if rateDo(rate_attitude, self.tick):
+		if rateDo(self.rate_attitude, self.tick, self.rate_main):
 			self.tau = self.attitudeCtrl(self.etaDesired, eta_fw, etadot_fw)
 		self.tick = self.tick + 1
 		# output PWM values
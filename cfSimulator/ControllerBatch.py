@@ -0,0 +1,145 @@
+# class implementing the PID controller of the Crazyflie for N drones at once
+import numpy as np
+from .utils import PIDBank
+from .Controller import rate_main, rate_position, rate_attitude, rateDo,\
+                        pos_lpf_enable, att_lpf_enable,\
+                        thrust_min, thrust_max, roll_limit, pitch_limit,\
+                        pid_gains, pid_Iclamps, pid_cutoffs
+
+'''
+	Batched controller class: same cascade as cfPIDController, with
+	gains, filter cutoffs and saturations that can differ per drone
+'''
+class cfPIDControllerBatch():
+
+	def __init__(self, n, config, b, I, m, g, k, l, gains=None, Iclamps=None, cutoffs=None,\
+	             thrust_min=thrust_min, thrust_max=thrust_max,\
+	             roll_limit=roll_limit, pitch_limit=pitch_limit, simConfig=None):
+		# n       : number of drones
+		# gains   : (kp, ki, kd) of the "pos", "vel", "att" and "rate" loops,
+		# Iclamps : integral clamps of the loops
+		# cutoffs : derivative filter cutoffs of the loops
+		#           each value is a scalar, an array per axis (3), or per drone and axis (Nx3);
+		#           loops that are not given take the values of cfPIDController
+		# saturations are scalars or arrays with one value per drone (N)
+		# simConfig : SimulationConfig with the loop rates (default: module macros)
+		#drone parameters
+		self.n = n
+		self.b = b
+		self.I = I
+		self.g = g
+		self.m = m
+		self.k = k
+		self.l = l
+		self.config = config
+
+		# execution of different control loops
+		if simConfig is None:
+			self.rate_main, self.rate_attitude, self.rate_position = rate_main, rate_attitude, rate_position
+		else:
+			self.rate_main     = simConfig.mainRate
+			self.rate_attitude = simConfig.rate_attitude
+			self.rate_position = simConfig.rate_position
+		posDT = 1/self.rate_position
+		attDT = 1/self.rate_attitude
+
+		# saturations
+		self.thrust_min  = np.broadcast_to(thrust_min, (n,))
+		self.thrust_max  = np.broadcast_to(thrust_max, (n,))
+		self.roll_limit  = np.broadcast_to(roll_limit, (n,))
+		self.pitch_limit = np.broadcast_to(pitch_limit, (n,))
+
+		# controller states
+		self.tick = 1
+		self.T    = np.zeros(n)
+		self.tau  = np.zeros((n,3), dtype=int)
+		self.etaDesired = np.zeros((n,3))
+
+		# PID controllers, one row per drone
+		gains   = {} if gains is None else gains
+		Iclamps = {} if Iclamps is None else Iclamps
+		cutoffs = {} if cutoffs is None else cutoffs
+		self.posPID  = self.stageBank("pos", gains, Iclamps, cutoffs, posDT, pos_lpf_enable, self.rate_position)
+		self.velPID  = self.stageBank("vel", gains, Iclamps, cutoffs, posDT, pos_lpf_enable, self.rate_position)
+		self.attPID  = self.stageBank("att", gains, Iclamps, cutoffs, attDT, att_lpf_enable, self.rate_attitude)
+		self.ratePID = self.stageBank("rate", gains, Iclamps, cutoffs, attDT, att_lpf_enable, self.rate_attitude)
+
+	def stageBank(self, stage, gains, Iclamps, cutoffs, dt, lp_enable, rate):
+		# PID bank of one stage of the cascade, with shape Nx3
+		kp, ki, kd = gains.get(stage, pid_gains[stage])
+		shape = (self.n, 3)
+		return PIDBank(np.broadcast_to(kp, shape), ki, kd, dt, lp_enable, rate,\
+		               cutoffs.get(stage, pid_cutoffs[stage]), Iclamps.get(stage, pid_Iclamps[stage]))
+
+	#############################
+	### TORQUE -> PWM MAPPING ###
+	#############################
+
+	def forcesToPWMcrossConfig(self, T, tau):
+		# input : T: thrust -- np array N, tau: torques -- np array Nx3
+		# output: PWM signals -- np array Nx4
+		r = tau[:,0] / 2
+		p = tau[:,1] / 2
+		y = tau[:,2]
+		pwm = np.stack((T - r + p + y,\
+		                T - r - p - y,\
+		                T + r - p + y,\
+		                T + r + p - y), axis=1)
+		# saturate to actuator limits
+		return np.clip(pwm,0,65535)
+
+	############################
+	### CONTROLLER FUNCTIONS ###
+	############################
+
+	def positionCtrl(self, ref, pos, vel, eta):
+		# position controller: from desired and estimated positions to desired attitudes
+		v_ref = self.posPID.run(ref, pos)
+		# NOTE: firmware inverts the naming of roll and pitch for -Raw variables
+		out = self.velPID.run(v_ref, vel)
+		pitchRaw = out[:,0]
+		rollRaw  = out[:,1]
+		thrust   = out[:,2]
+		roll  = - rollRaw  * np.cos(eta[:,2]*np.pi/180.0) - pitchRaw * np.sin(eta[:,2]*np.pi/180.0)
+		pitch = - pitchRaw * np.cos(eta[:,2]*np.pi/180.0) + rollRaw  * np.sin(eta[:,2]*np.pi/180.0)
+		roll  = np.clip(roll ,-self.roll_limit,self.roll_limit)
+		pitch = np.clip(pitch,-self.pitch_limit,self.pitch_limit)
+		thrustScale = 1000
+		thrustBase   = 36000
+		thrust = np.clip(thrust*thrustScale+thrustBase, self.thrust_min, self.thrust_max)
+		return thrust, np.stack((roll, pitch, np.zeros(self.n)), axis=1)
+
+	def attitudeCtrl(self, etaDesired, eta, etadot):
+		etadot_ref = self.attPID.run(etaDesired, eta)
+		# torques are integers as in the firmware
+		tau = self.ratePID.run(etadot_ref, etadot).astype(int)
+		return tau
+
+	def heldTicks(self):
+		# number of upcoming calls to ctrlCompute that will return
+		# the same PWM values of the last call (no control loop runs)
+		n = 0
+		while not(rateDo(self.rate_position, self.tick+n, self.rate_main)) and\
+		      not(rateDo(self.rate_attitude, self.tick+n, self.rate_main)):
+			n = n+1
+		return n
+
+	def ctrlCompute(self, pos_r, pos, vel, eta, gyro):
+		# main controller function, all inputs are Nx3 arrays
+		# (one row per drone) and the output is an Nx4 array of PWM values
+
+		# _fw variables are the translation of states into firmware conventions:
+		# 1) controller tuning is based on angles in degrees
+		# 2) pitch sign reference in KF is inverted
+		# 3) yaw sign reference in KF is inverted
+		eta_fw    =  (eta*180.0/np.pi)*np.array([1,-1,-1])
+		etadot_fw = (gyro*180.0/np.pi)*np.array([1,-1,-1])
+		# position control
+		if rateDo(self.rate_position, self.tick, self.rate_main):
+			self.T, self.etaDesired = self.positionCtrl(pos_r, pos, vel, eta_fw)
+		# attitude control
+		if rateDo(self.rate_attitude, self.tick, self.rate_main):
+			self.tau = self.attitudeCtrl(self.etaDesired, eta_fw, etadot_fw)
+		self.tick = self.tick + 1
+		# output PWM values
+		return self.forcesToPWMcrossConfig(self.T, self.tau)
@@ -0,0 +1,59 @@
+"""
+precomputed mapping from motor PWM commands to body forces.
+The chain pwm -> rotor thrust -> rotor speed is tabulated once as the
+squared rotor speed of each motor on a grid of PWM values, and the body
+forces are obtained with a single mixer matrix multiplication
+"""
+
+import numpy as np
+
+# tables already built, indexed by the parameters they depend on
+cache = {}
+
+class ForcesTable():
+	def __init__(self, physics, resolution=1):
+		# input : physics: cfPhysics (or cfPhysicsBatch) providing the mapping functions
+		#         resolution: PWM spacing of the grid points
+		self.resolution = resolution
+		pwm = np.arange(0, 65535+resolution, resolution, dtype=float)
+		self.pwm_max = pwm[-1]
+		# squared rotor speed of each motor at the grid points,
+		# stored one motor after the other with the slopes to the next point
+		omega = physics.thrustToOmega(physics.pwmToThrust(pwm))
+		omega = np.clip(omega, physics.omega_min_lim, physics.omega_max_lim)
+		omegasq = np.tile(omega**2, (physics.n_inputs,1))
+		slopes  = np.zeros_like(omegasq)
+		slopes[:,:-1] = np.diff(omegasq, axis=1)
+		self.table   = omegasq.ravel()
+		self.slopes  = slopes.ravel()
+		self.offsets = np.arange(physics.n_inputs)*len(pwm) # start of each motor
+		self.mixer   = physics.mixerMatrix()
+
+	def omegaSquared(self, u):
+		# linear interpolation of the squared rotor speeds
+		# input : PWM signals -- np array 4 (or Nx4)
+		# output: squared rotor speeds -- np array 4 (or Nx4)
+		p = np.clip(u, 0, self.pwm_max)/self.resolution
+		i = p.astype(int)
+		f = p-i
+		i = i+self.offsets
+		return np.take(self.table, i) + np.take(self.slopes, i)*f
+
+	def __deepcopy__(self, memo):
+		# the table is never modified, copies of a physics object (e.g.,
+		# forks of a simulation state) share it
+		return self
+
+	def forces(self, u):
+		# input : PWM signals -- np array 4 (or Nx4)
+		# output: vertical thrust and body torques -- np array 4 (or Nx4)
+		return self.omegaSquared(u).dot(self.mixer.T)
+
+def forcesTable(physics, resolution=1):
+	# returns the table for the parameters of physics, building it only
+	# the first time a parameter set is used
+	key = (type(physics).__name__, physics.config, physics.k, physics.b, physics.l,\
+	       physics.omega_min_lim, physics.omega_max_lim, resolution)
+	if not(key in cache):
+		cache[key] = ForcesTable(physics, resolution)
+	return cache[key]
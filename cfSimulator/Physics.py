@@ -9,7 +9,8 @@ import math
 import scipy.integrate as intgr
 import sys
 
-import random as rnd
+from .utils import NoiseStream, sensorSeeds
+from .ForcesTable import forcesTable
 
 ## error classes
 class Integration_Failed(BaseException):
@@ -18,8 +19,25 @@ class Integration_Failed(BaseException):
 class Drone_Crash(BaseException):
     pass
 
+# available integration methods for one simulation step
+integrators = ["RK45",          # adaptive scipy solver (reference)
+               "RK4",           # fixed-step classic Runge-Kutta
+               "semi-implicit"] # fixed-step semi-implicit (symplectic) Euler
+
+# available implementations of the state derivative
+kernels = ["reference", # readable implementation, allocates its matrices at every call
+           "cached"]    # constant matrices computed once, results written in preallocated buffers
+
 class cfPhysics():
-	def __init__(self, seed=1, do_not_reset_seed=False):
+	def __init__(self, seed=1, do_not_reset_seed=False, integrator="RK45", kernel="reference", zoh=False, useForcesTable=False, simConfig=None):
+		# simConfig: SimulationConfig with the integration options
+		#            (if given, it overrides the corresponding arguments)
+		if simConfig is not None:
+			integrator     = simConfig.integrator
+			kernel         = simConfig.kernel
+			zoh            = simConfig.zoh
+			useForcesTable = simConfig.forcesTable
+
 		# Parameters
 		self.g   = 9.81       # m/s^2 
 		self.m   = 0.027+0.004      # kg
@@ -39,6 +57,51 @@ class cfPhysics():
 		self.n_states = 13  # Number of states
 		self.n_inputs = 4   # Number of inputs
 
+		# Integration method used by simulate()
+		if not(integrator in integrators):
+			sys.exit("unknown integrator: " + str(integrator))
+		self.integrator = integrator
+
+		# Precomputed PWM to forces mapping (built once per parameter set)
+		self.table = forcesTable(self) if useForcesTable else None
+
+		# Zero-order-hold mode: an input held for several steps is
+		# mapped to forces once and integrated in a single solver call
+		self.zoh = zoh
+		self.heldInput  = None # last input applied
+		self.heldForces = None # body forces of the last input
+		self.heldTimes  = []   # upcoming times already integrated with the held input
+		self.heldStates = []   # states at the times in heldTimes
+		self.solverCalls = 0   # number of integration restarts
+
+		# Implementation of the state derivative
+		if not(kernel in kernels):
+			sys.exit("unknown kernel: " + str(kernel))
+		self.kernel = kernel
+		if self.kernel=="cached" :
+			# constant matrices
+			self.J        = np.diag(self.I)
+			self.Jinv     = np.linalg.inv(self.J)
+			self.dragMat  = np.diag(self.A)
+			self.dragGain = -1/self.m
+			self.Gground  = np.array([0, 0, 0])
+			self.Gair     = np.array([0, 0, -self.g])
+			# preallocated buffers
+			self.qn     = np.zeros(4)              # normalized quaternion
+			self.angM   = np.zeros(3)              # thrust direction
+			self.qMat   = np.zeros((4,4))          # quaternion kinematics matrix
+			self.w4     = np.zeros(4)              # attitude rate as pure quaternion
+			self.Jw     = np.zeros(3)              # angular momentum
+			self.torque = np.zeros(3)              # torque net of gyroscopic term
+			self.xdot   = np.zeros(self.n_states+4) # state derivative
+			# buffers for the fixed-step integrators
+			self.xu    = np.zeros(self.n_states+4)
+			self.stage = np.zeros(self.n_states+4)
+			self.k1    = np.zeros(self.n_states+4)
+			self.k2    = np.zeros(self.n_states+4)
+			self.k3    = np.zeros(self.n_states+4)
+			self.k4    = np.zeros(self.n_states+4)
+
 		# States 
 		# Initialize State Conditions
 		self.x = np.zeros(self.n_states)
@@ -52,11 +115,19 @@ class cfPhysics():
 		                     [0,0,1]]) # rotation matrix
 
 		# Measurement Noise Parameters
-		if not(do_not_reset_seed):
-			rnd.seed(seed)
+		# each sensor draws from its own stream, derived from the seed
+		# (an integer or a numpy SeedSequence, see utils.noiseSeeds)
+		if do_not_reset_seed:
+			seed = None # fresh entropy: a different noise realisation at each run
+		self.seed = np.random.SeedSequence(seed) if not(isinstance(seed, np.random.SeedSequence)) else seed
 		self.accNoiseVar  = np.array([0.5,0.5,1.0]) # accelerometer noise variance
 		self.gyroNoiseVar = np.array([0.1,0.1,0.1]) # gyro noise variance
 		self.flowNoiseVar = np.array([2, 2])        # flowdeck noise variance
+		accSeed, gyroSeed, flowSeed, zSeed = sensorSeeds(self.seed)
+		self.accNoise  = NoiseStream(accSeed,  self.accNoiseVar)
+		self.gyroNoise = NoiseStream(gyroSeed, self.gyroNoiseVar)
+		self.flowNoise = NoiseStream(flowSeed, self.flowNoiseVar)
+		self.zNoise    = NoiseStream(zSeed) # scaled by the distance dependent std
 		# zRagner noise model coefficients
 		self.expPointA = 2.5 
 		self.expStdA   = 0.0025
@@ -160,9 +231,28 @@ class cfPhysics():
 		Tbar     = np.array([T, tauPhi, tauTheta, tauPsi]) 
 		return Tbar
 
+	def mixerMatrix(self, config=None):
+		# matrix mapping the squared rotor speeds to the body forces
+		# (vertical thrust and torques) for the given configuration
+		if config is None:
+			config = self.config
+		kl = self.k*self.l
+		if config=="plus" :
+			return np.array([[ self.k,  self.k,  self.k,  self.k],\
+			                 [      0,     -kl,       0,      kl],\
+			                 [    -kl,       0,      kl,       0],\
+			                 [-self.b,  self.b, -self.b,  self.b]])
+		kl = kl/np.sqrt(2)
+		return np.array([[ self.k,  self.k,  self.k,  self.k],\
+		                 [    -kl,     -kl,      kl,      kl],\
+		                 [    -kl,      kl,      kl,     -kl],\
+		                 [-self.b,  self.b, -self.b,  self.b]])
+
 	def pwdToForcesMap(self, u):
 		# wrapper for mapping:
 		# pwd -> rotor thrust -> rotor speed -> body forces
+		if self.table is not None : # precomputed mapping
+			return self.table.forces(u)
 		if self.config=="plus" : # plus configuration
 			return self.omegaToThrustPlusConfig(self.thrustToOmega((self.pwmToThrust(u))))
 		else :                   # cross configuration
@@ -216,12 +306,56 @@ class cfPhysics():
 
 		return vdot, qdot, wdot
 
+	def quad_accelerationCached(self, T, tau, v, q, w):
+		# same as quad_acceleration, but writes the accelerations in
+		# self.xdot[3:13] using the constant matrices and buffers
+		# allocated in __init__
+		q  = np.divide(q, np.sqrt(q[0]**2+q[1]**2+q[2]**2+q[3]**2), out=self.qn)
+		qw = q[0]
+		qx = q[1]
+		qy = q[2]
+		qz = q[3]
+
+		if self.x[2]<0.001 :
+			Ga = self.Gground # gravity companesated by contact force
+			self.x[2]=0.0
+		else:
+			Ga = self.Gair
+		vdot = self.xdot[3:6]
+		Aa   = np.dot(self.dragMat, v, out=self.Jw)    # Drag
+		Aa  *= self.dragGain
+		angM = self.angM
+		angM[0] = 2*(qx*qz + qw*qy)
+		angM[1] = 2*(qy*qz - qw*qx)
+		angM[2] = qw**2 - qx**2 - qy**2 + qz**2
+		np.multiply(T/self.m, angM, out=vdot)          # vertical thrust
+		vdot += Ga
+		vdot += Aa
+
+		M = self.qMat
+		M[0,0] =  qw; M[0,1] = -qx; M[0,2] = -qy; M[0,3] = -qz
+		M[1,0] =  qx; M[1,1] =  qw; M[1,2] = -qz; M[1,3] =  qy
+		M[2,0] =  qy; M[2,1] =  qz; M[2,2] =  qw; M[2,3] = -qx
+		M[3,0] =  qz; M[3,1] = -qy; M[3,2] =  qx; M[3,3] =  qw
+		self.w4[1:4] = w
+		qdot = np.dot(M, self.w4, out=self.xdot[6:10])
+		qdot *= 0.5
+
+		Jw = np.dot(self.J, w, out=self.Jw)
+		torque = self.torque
+		torque[0] = tau[0] - (w[1]*Jw[2] - w[2]*Jw[1])
+		torque[1] = tau[1] - (w[2]*Jw[0] - w[0]*Jw[2])
+		torque[2] = tau[2] - (w[0]*Jw[1] - w[1]*Jw[0])
+		np.dot(self.Jinv, torque, out=self.xdot[10:13])
+
 	def stateDerivative(self, t, xu):
 		# compute derivative in given state
 		# input : xu: states and inputs -- np array 17x1
 		# output: derivative of the system. the zeros represent
 		#         the fact that the control action doesn't change 
 		#         between one simulation call and the next one
+		#         NOTE: with the cached kernel the returned array is
+		#         a buffer overwritten at the next call
 
 		# unwrap inputs
 		T   = xu[13]
@@ -230,33 +364,151 @@ class cfPhysics():
 		v = xu[3:6]  
 		q = xu[6:10]
 		w = xu[10:13]
+		if self.kernel=="cached" :
+			self.xdot[0:3] = v
+			self.quad_accelerationCached(T, tau, v, q, w)
+			return self.xdot
 		vdot, qdot, wdot = self.quad_acceleration(T, tau, v, q, w)
 		return np.concatenate((v,vdot, qdot, wdot,[0,0,0,0])) 
 
-	def simulate(self, until, u):
+	def stateDerivativeCopy(self, t, xu):
+		# state derivative returned in a new array, for solvers
+		# that keep references to the evaluated derivatives
+		return self.stateDerivative(t, xu).copy()
+
+	def stepRK4(self, dt, Tbar):
+		# fixed-step classic Runge-Kutta over one step of length dt
+		# input : dt: step length
+		#         Tbar: body forces (held constant over the step)
+		# output: advances self.x in place
+		if self.kernel=="cached" :
+			self.stepRK4Cached(dt, Tbar)
+			return
+		xu = np.concatenate((self.x, Tbar))
+		k1 = self.stateDerivative(0, xu)
+		k2 = self.stateDerivative(0, xu + (dt/2)*k1)
+		k3 = self.stateDerivative(0, xu + (dt/2)*k2)
+		k4 = self.stateDerivative(0, xu + dt*k3)
+		self.x[:] = xu[0:self.n_states] + (dt/6)*(k1+2*k2+2*k3+k4)[0:self.n_states]
+
+	def stepRK4Cached(self, dt, Tbar):
+		# same as stepRK4, with all the stages stored in the
+		# buffers allocated in __init__
+		xu = self.xu
+		xu[0:self.n_states] = self.x
+		xu[self.n_states:]  = Tbar
+		stage = self.stage
+		np.copyto(self.k1, self.stateDerivative(0, xu))
+		np.add(xu, np.multiply(dt/2, self.k1, out=stage), out=stage)
+		np.copyto(self.k2, self.stateDerivative(0, stage))
+		np.add(xu, np.multiply(dt/2, self.k2, out=stage), out=stage)
+		np.copyto(self.k3, self.stateDerivative(0, stage))
+		np.add(xu, np.multiply(dt, self.k3, out=stage), out=stage)
+		np.copyto(self.k4, self.stateDerivative(0, stage))
+		# k1+2*k2+2*k3+k4
+		np.multiply(2, self.k2, out=stage)
+		np.add(self.k1, stage, out=self.k1)
+		np.multiply(2, self.k3, out=stage)
+		np.add(self.k1, stage, out=self.k1)
+		np.add(self.k1, self.k4, out=self.k1)
+		np.multiply(dt/6, self.k1, out=self.k1)
+		np.add(xu[0:self.n_states], self.k1[0:self.n_states], out=self.x)
+
+	def stepSemiImplicitEuler(self, dt, Tbar):
+		# fixed-step semi-implicit Euler over one step of length dt:
+		# velocities are advanced first and the new velocities are
+		# used to advance position and attitude
+		# input : dt: step length
+		#         Tbar: body forces (held constant over the step)
+		# output: advances self.x in place
+		xu = np.concatenate((self.x, Tbar))
+		xdot = self.stateDerivative(0, xu)
+		self.x[:] = xu[0:self.n_states]
+		self.x[3:6]   = self.x[3:6]   + dt*xdot[3:6]   # speed
+		self.x[10:13] = self.x[10:13] + dt*xdot[10:13] # attitude rate
+		self.x[0:3]   = self.x[0:3]   + dt*self.x[3:6] # position
+		q = self.x[6:10]
+		w = self.x[10:13]
+		qdot = 0.5*np.concatenate(([-q[1:4].dot(w)], q[0]*w + np.cross(q[1:4], w)))
+		self.x[6:10]  = self.quatNormal(q + dt*qdot)   # attitude
+
+	def simulate(self, until, u, held=()):
 		# input : until: absolute time until which the simulation should last
 		#         u: PWD inputs to the 4 motors
+		#         held: upcoming times (after until) up to which the caller
+		#               will keep applying u, only used in zero-order-hold mode
 		# output: returns unwrapped state
 		
 		if until<self.currentTime :  # check time input
 			sys.exit("are you sure you want to simulate backward in time?")
-		Tbar = self.pwdToForcesMap(u)
-		sol  = intgr.solve_ivp(fun=self.stateDerivative, \
-			                   t_span=(self.currentTime, until),\
-			                   method="RK45" ,\
-			                   y0=np.concatenate((self.x, Tbar.T)) \
-			                  )
-		# stop if integration failed
-		if sol.success==False :
-			print("integration of ODE failed")
-			raise Integration_Failed
+		if self.zoh and (self.heldInput is not None) and np.array_equal(u, self.heldInput) :
+			Tbar = self.heldForces
+			if len(self.heldTimes) and self.heldTimes[0]==until :
+				# state already integrated during the held interval
+				self.heldTimes.pop(0)
+				self.x = self.heldStates.pop(0)
+				self.currentTime = until
+				self.updateMeasurements(Tbar)
+				return self.x
+		else :
+			Tbar = self.pwdToForcesMap(u)
+			if self.zoh :
+				self.heldInput  = np.array(u)
+				self.heldForces = Tbar
+		self.heldTimes  = []
+		self.heldStates = []
+		if self.integrator=="RK45" :
+			if self.kernel=="cached" :
+				fun = self.stateDerivativeCopy
+			else :
+				fun = self.stateDerivative
+			if self.zoh and len(held) and self.airborne(held[-1]-self.currentTime) :
+				# integrate over the whole held interval and sample each step
+				t_eval = np.concatenate(([until], held))
+			else :
+				t_eval = None
+			sol  = intgr.solve_ivp(fun=fun, \
+				                   t_span=(self.currentTime, until if t_eval is None else t_eval[-1]),\
+				                   method="RK45" ,\
+				                   y0=np.concatenate((self.x, Tbar.T)), \
+				                   t_eval=t_eval \
+				                  )
+			self.solverCalls = self.solverCalls + 1
+			# stop if integration failed
+			if sol.success==False :
+				print("integration of ODE failed")
+				raise Integration_Failed
+			if t_eval is None :
+				self.x = sol.y[0:self.n_states,-1]
+			else :
+				self.x = sol.y[0:self.n_states,0]
+				self.heldTimes  = list(t_eval[1:])
+				self.heldStates = list(sol.y[0:self.n_states,1:].T)
+		elif until>self.currentTime :
+			if self.integrator=="RK4" :
+				self.stepRK4(until-self.currentTime, Tbar)
+			else :
+				self.stepSemiImplicitEuler(until-self.currentTime, Tbar)
+			self.solverCalls = self.solverCalls + 1
+			# stop if integration failed
+			if not(np.isfinite(self.x).all()) :
+				print("integration of ODE failed")
+				raise Integration_Failed
 		self.currentTime = until
-		self.x = sol.y[0:self.n_states,-1]
-		# update measurements 
+		self.updateMeasurements(Tbar)
+		return self.x 
+
+	def airborne(self, dt):
+		# true if the ground contact cannot switch within dt, that is
+		# the drone stays above the contact threshold even falling
+		# at twice its current vertical speed
+		return self.x[2] - 2*abs(self.x[5])*dt > 0.001
+
+	def updateMeasurements(self, Tbar):
+		# update variables used by the measurement functions
 		xu = self.stateDerivative(0, np.concatenate((self.x, Tbar.T))) # first input is not used
 		self.R    = self.computeR(self.x[6:10]) # rotation matrix
 		self.acc  = xu[3:6] + self.R.dot(np.array([0, 0, self.g]))     # add gravity in body frame
-		return self.x 
 
 	#############################
 	### MEASUREMENT FUNCTIONS ###
@@ -265,19 +517,13 @@ class cfPhysics():
 	def readAcc(self, Noise=0):
 		# accelerometer reading in m/s^2
 		if Noise :
-			nx = Noise * rnd.normalvariate(0,self.accNoiseVar[0])
-			ny = Noise * rnd.normalvariate(0,self.accNoiseVar[1])
-			nz = Noise * rnd.normalvariate(0,self.accNoiseVar[2])
-			return self.acc + np.array([nx,ny,nz])
+			return self.acc + Noise * self.accNoise.draw()
 		return self.acc
 
 	def readGyro(self, Noise=0):
 		# gyro reading in rad/s
 		if Noise : 
-			nx = Noise * rnd.normalvariate(0,self.gyroNoiseVar[0])
-			ny = Noise * rnd.normalvariate(0,self.gyroNoiseVar[1])
-			nz = Noise * rnd.normalvariate(0,self.gyroNoiseVar[2])
-			return self.x[10:13] + np.array([nx,ny,nz])
+			return self.x[10:13] + Noise * self.gyroNoise.draw()
 		return self.x[10:13]
 
 	def readZRanging(self, Noise=0):
@@ -294,7 +540,7 @@ class cfPhysics():
 				angle = np.pi-0.001 # send out a very large reading (firmware has to handle it)
 			if Noise :
 				nz = self.expStdA * (1 + np.exp(self.expCoeff * (self.x[2] - self.expPointA)))
-				ret = self.x[2]/np.cos(angle) + Noise * rnd.normalvariate(0,nz)
+				ret = self.x[2]/np.cos(angle) + Noise * nz * self.zNoise.draw()
 				if ret<0 :
 					return 0
 				else :
@@ -319,8 +565,9 @@ class cfPhysics():
 		# predictedNY 
 		dny = (dt * Npx / thetapx) * ((velBF[1]*R22 / h) + wFactor * self.x[10])
 		if Noise :
-			dnx = dnx + Noise * rnd.normalvariate(0,self.flowNoiseVar[0])
-			dny = dny + Noise * rnd.normalvariate(0,self.flowNoiseVar[1])
+			n   = self.flowNoise.draw()
+			dnx = dnx + Noise * n[0]
+			dny = dny + Noise * n[1]
 		if Quantisation:
 			return np.array([int(np.rint(dnx)), int(np.rint(dny))])
 		else:
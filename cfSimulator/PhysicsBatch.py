@@ -0,0 +1,350 @@
+"""
+vectorized physical model of N independent drones.
+Implements the same model of cfPhysics, with the states of all
+the drones stored as rows of an (N, 13) array so that dynamics and
+measurements of the whole fleet are evaluated in one call
+"""
+
+import numpy as np
+import scipy.integrate as intgr
+import sys
+
+from .Physics import cfPhysics, integrators
+from .utils import NoiseStream, sensorSeeds
+from .ForcesTable import forcesTable
+
+class cfPhysicsBatch():
+	def __init__(self, n, seed=1, integrator="RK4", useForcesTable=False):
+		# Parameters (shared by all drones, taken from the single drone model)
+		model = cfPhysics(do_not_reset_seed=True)
+		self.g   = model.g
+		self.m   = model.m
+		self.l   = model.l
+		self.k   = model.k
+		self.b   = model.b
+		self.Ism = model.Ism
+		self.I   = np.array(model.I)
+		self.A   = np.array(model.A)
+		self.config = model.config
+
+		# Rotor speed saturations
+		self.omega_min_lim = model.omega_min_lim
+		self.omega_max_lim = model.omega_max_lim
+
+		# Model size
+		self.n        = n               # Number of drones
+		self.n_states = model.n_states  # Number of states
+		self.n_inputs = model.n_inputs  # Number of inputs
+
+		# Integration method used by simulate()
+		if not(integrator in integrators):
+			sys.exit("unknown integrator: " + str(integrator))
+		self.integrator = integrator
+
+		# Mixer matrix: body forces = omega^2 @ M.T
+		self.mixer = model.mixerMatrix()
+
+		# Precomputed PWM to forces mapping (built once per parameter set)
+		self.table = forcesTable(self) if useForcesTable else None
+
+		# States
+		# Initialize State Conditions
+		self.x = np.zeros((self.n, self.n_states))
+		self.x[:,6] = 1 # attitude quaternion has always norm 1
+		self.currentTime = 0.0 # (relative) time at which the model is
+
+		# Per-drone flags
+		self.onGround = np.ones(self.n, dtype=bool)   # gravity compensated by contact force
+		self.crashed  = np.zeros(self.n, dtype=bool)  # tilted past the z-ranger limit
+		self.failed   = np.zeros(self.n, dtype=bool)  # integration diverged
+
+		# Variales for measurements computation
+		self.acc = np.zeros((self.n, 3))              # acceleration
+		self.R   = np.tile(np.identity(3), (self.n,1,1)) # rotation matrices
+
+		# Measurement Noise Parameters
+		# each sensor draws from its own stream, derived from the seed
+		self.seed = np.random.SeedSequence(seed) if not(isinstance(seed, np.random.SeedSequence)) else seed
+		self.accNoiseVar  = model.accNoiseVar
+		self.gyroNoiseVar = model.gyroNoiseVar
+		self.flowNoiseVar = model.flowNoiseVar
+		accSeed, gyroSeed, flowSeed, zSeed = sensorSeeds(self.seed)
+		blocks = max(1, 65536//self.n) # samples of the whole fleet per block
+		self.accNoise  = NoiseStream(accSeed,  np.tile(self.accNoiseVar, (self.n,1)), blocks)
+		self.gyroNoise = NoiseStream(gyroSeed, np.tile(self.gyroNoiseVar, (self.n,1)), blocks)
+		self.flowNoise = NoiseStream(flowSeed, np.tile(self.flowNoiseVar, (self.n,1)), blocks)
+		self.zNoise    = NoiseStream(zSeed, np.ones(self.n), blocks) # scaled by the distance dependent std
+		# zRagner noise model coefficients
+		self.expPointA = model.expPointA
+		self.expStdA   = model.expStdA
+		self.expCoeff  = model.expCoeff
+
+	@property
+	def active(self):
+		# drones that are still being simulated
+		return ~(self.crashed | self.failed)
+
+	##############################
+	### MATH UTILITY FUNCTIONS ###
+	##############################
+
+	def quatNormal(self, q):
+		# utilitiy function: normalize quaternions
+		# input : quaternions -- np array Nx4
+		# output: quaternions -- np array Nx4
+		return q/np.sqrt(np.sum(q**2, axis=1))[:,None]
+
+	def quaternionToEuler(self, q):
+		#utility function to translate quaternions in Euler angles
+		# input : quaternions -- np array Nx4
+		# output: euler angles -- np array Nx3
+		phi   = np.arctan2(2*(q[:,0]*q[:,1] + q[:,2]*q[:,3]), 1-2*(q[:,1]**2+q[:,2]**2))
+		theta = np.arcsin(np.clip(2*(q[:,0]*q[:,2] - q[:,3]*q[:,1]), -1, 1))
+		psi   = np.arctan2(2*(q[:,0]*q[:,3] + q[:,1]*q[:,2]), 1-2*(q[:,2]**2+q[:,3]**2))
+		return np.stack((phi, theta, psi), axis=1)
+
+	def computeR(self, q):
+		# computes rotation matrices from quaternions
+		# input : quaternions -- np array Nx4
+		# output: rotation matrices -- np array Nx3x3
+		q = self.quatNormal(q)
+		qw = q[:,0]
+		qx = q[:,1]
+		qy = q[:,2]
+		qz = q[:,3]
+		R = np.empty((q.shape[0],3,3))
+		R[:,0,0] = qw**2+qx**2-qy**2-qz**2
+		R[:,0,1] = 2*(qx*qy-qw*qz)
+		R[:,0,2] = 2*(qx*qz+qw*qy)
+		R[:,1,0] = 2*(qx*qy+qw*qz)
+		R[:,1,1] = qw**2-qx**2+qy**2-qz**2
+		R[:,1,2] = 2*(qy*qz-qw*qx)
+		R[:,2,0] = 2*(qx*qz-qw*qy)
+		R[:,2,1] = 2*(qy*qz+qw*qx)
+		R[:,2,2] = qw**2-qx**2-qy**2+qz**2
+		return R
+
+	######################################
+	### MAPPING FUNCTIONS PWM<->THRUST ###
+	######################################
+
+	def pwmToThrust(self, pwm):
+		# input : PWM signals to the motors -- np array Nx4
+		# output: thrust of each rotor -- np array Nx4
+		pwm = np.clip(pwm, 0, 65535)
+		d = pwm/65535.0 # duty cycle
+		beta1 = 0.35
+		beta2 = 0.26
+		return beta1*d + beta2*(d**2)
+
+	def thrustToOmega(self, T):
+		# input : thrust generated by each motor -- np array Nx4
+		# output: speed of each rotor -- np array Nx4
+		beta1 = -1.97e-7
+		beta2 =  9.78e-8
+		return -beta1/(2*beta2) + np.sqrt((beta1/(2*beta2))**2 + T/beta2)
+
+	def omegaToThrust(self, omega):
+		# input : rotors speeds -- np array Nx4
+		# output: vertical thrust and body torques -- np array Nx4
+		omega = np.clip(omega, self.omega_min_lim, self.omega_max_lim)
+		return (omega**2).dot(self.mixer.T)
+
+	def mixerMatrix(self, config=None):
+		# matrix mapping the squared rotor speeds to the body forces
+		return cfPhysics.mixerMatrix(self, config)
+
+	def pwdToForcesMap(self, u):
+		# wrapper for mapping:
+		# pwd -> rotor thrust -> rotor speed -> body forces
+		if self.table is not None : # precomputed mapping
+			return self.table.forces(u)
+		return self.omegaToThrust(self.thrustToOmega(self.pwmToThrust(u)))
+
+	############################
+	### SIMULATION FUNCTIONS ###
+	############################
+
+	def quad_acceleration(self, T, tau, v, q, w, onGround=None):
+		# input : system input, and states of all drones
+		#         T   : vertical thrust -- np array N
+		#         tau : torques in body frame -- np array Nx3
+		#         v   : speed -- np array Nx3
+		#         q   : attitude quaternion -- np array Nx4
+		#         w   : attitude rate -- np array Nx3
+		#         onGround: ground contact of the drones -- np array N (default: all the drones)
+		# output: system accelerations
+		#         vdot : xyz acceleration -- np array Nx3
+		#         qdot : attitude acceleration (in quaternion) -- np array Nx4
+		#         wdot : attitude acceleration -- np array Nx3
+		q  = self.quatNormal(q)
+		qw = q[:,0]
+		qx = q[:,1]
+		qy = q[:,2]
+		qz = q[:,3]
+
+		# gravity is compensated by the contact force for drones on the ground
+		Ga = np.zeros((q.shape[0],3))
+		Ga[:,2] = np.where(self.onGround if onGround is None else onGround, 0, -self.g)
+		Aa   = -1/self.m * self.A * v                   # Drag
+		angM = np.stack((2*(qx*qz + qw*qy),\
+		                 2*(qy*qz - qw*qx),\
+		                 qw**2 - qx**2 - qy**2 + qz**2), axis=1)
+		Ta   = (T/self.m)[:,None] * angM                # vertical thrust
+		vdot = Ga + Ta + Aa
+
+		qv   = q[:,1:4]
+		qdot = np.empty_like(q)
+		qdot[:,0]   = -0.5*np.sum(qv*w, axis=1)
+		qdot[:,1:4] = 0.5*(qw[:,None]*w + np.cross(qv, w))
+
+		wdot = (tau - np.cross(w, self.I*w))/self.I
+
+		return vdot, qdot, wdot
+
+	def stateDerivative(self, t, xu, onGround=None):
+		# compute derivative in given states
+		# input : xu: states and inputs -- np array Nx17
+		#         onGround: ground contact of the drones in xu (default: all the drones)
+		# output: derivative of the systems, inputs are held constant
+		xdot = np.zeros_like(xu)
+		vdot, qdot, wdot = self.quad_acceleration(xu[:,13], xu[:,14:17],\
+		                                          xu[:,3:6], xu[:,6:10], xu[:,10:13], onGround)
+		xdot[:,0:3]   = xu[:,3:6]
+		xdot[:,3:6]   = vdot
+		xdot[:,6:10]  = qdot
+		xdot[:,10:13] = wdot
+		return xdot
+
+	def stepRK4(self, dt, xu, onGround=None):
+		# fixed-step classic Runge-Kutta over one step of length dt
+		# (onGround: ground contact of the drones in xu, see stateDerivative)
+		k1 = self.stateDerivative(0, xu, onGround)
+		k2 = self.stateDerivative(0, xu + (dt/2)*k1, onGround)
+		k3 = self.stateDerivative(0, xu + (dt/2)*k2, onGround)
+		k4 = self.stateDerivative(0, xu + dt*k3, onGround)
+		return xu[:,0:self.n_states] + (dt/6)*(k1+2*k2+2*k3+k4)[:,0:self.n_states]
+
+	def stepSemiImplicitEuler(self, dt, xu, onGround=None):
+		# fixed-step semi-implicit Euler over one step of length dt
+		xdot = self.stateDerivative(0, xu, onGround)
+		x = xu[:,0:self.n_states].copy()
+		x[:,3:6]   = x[:,3:6]   + dt*xdot[:,3:6]   # speed
+		x[:,10:13] = x[:,10:13] + dt*xdot[:,10:13] # attitude rate
+		x[:,0:3]   = x[:,0:3]   + dt*x[:,3:6]      # position
+		q = x[:,6:10]
+		w = x[:,10:13]
+		qdot = np.empty_like(q)
+		qdot[:,0]   = -0.5*np.sum(q[:,1:4]*w, axis=1)
+		qdot[:,1:4] = 0.5*(q[:,0:1]*w + np.cross(q[:,1:4], w))
+		x[:,6:10] = self.quatNormal(q + dt*qdot)  # attitude
+		return x
+
+	def stepRK45(self, until, xu, onGround=None):
+		# adaptive scipy solver over the flattened states of the drones in xu.
+		# The drones share the adaptive step, so the results depend (within the
+		# solver tolerance) on which drones are in the fleet. If the joint solve
+		# fails each drone is solved on its own, so that only the divergent ones
+		# are flagged as failed
+		x = self.solveRK45(until, xu, onGround)
+		if x is None:
+			x = np.full((len(xu), self.n_states), np.nan)
+			for i in range(len(xu) if len(xu)>1 else 0):
+				xi = self.solveRK45(until, xu[i:i+1], None if onGround is None else onGround[i:i+1])
+				if xi is not None:
+					x[i] = xi[0]
+		return x
+
+	def solveRK45(self, until, xu, onGround=None):
+		# states of the drones in xu at until, None if the solver failed
+		shape = xu.shape
+		sol = intgr.solve_ivp(fun=lambda t, y: self.stateDerivative(t, y.reshape(shape), onGround).ravel(),\
+		                      t_span=(self.currentTime, until),\
+		                      method="RK45",\
+		                      y0=xu.ravel())
+		if sol.success==False or not(np.isfinite(sol.y[:,-1]).all()):
+			return None
+		return sol.y[:,-1].reshape(shape)[:,0:self.n_states]
+
+	def simulate(self, until, u):
+		# input : until: absolute time until which the simulation should last
+		#         u: PWD inputs to the 4 motors of each drone -- np array Nx4
+		# output: returns the states of all drones -- np array Nx13
+		# crashed drones and drones whose integration failed are frozen
+
+		if until<self.currentTime :  # check time input
+			sys.exit("are you sure you want to simulate backward in time?")
+		Tbar = self.pwdToForcesMap(u)
+		xu = np.concatenate((self.x, Tbar), axis=1)
+		active = np.flatnonzero(self.active) # frozen drones are not integrated
+		if until>self.currentTime and len(active) :
+			dt = until-self.currentTime
+			xa, ground = xu[active], self.onGround[active]
+			if self.integrator=="RK4" :
+				x = self.stepRK4(dt, xa, ground)
+			elif self.integrator=="semi-implicit" :
+				x = self.stepSemiImplicitEuler(dt, xa, ground)
+			else :
+				x = self.stepRK45(until, xa, ground)
+			# flag drones whose integration failed
+			finite = np.isfinite(x).all(axis=1)
+			self.failed[active[~finite]] = True
+			self.x[active[finite]] = x[finite]
+		self.currentTime = until
+		# gravity compensated by contact force on the ground
+		self.onGround = self.x[:,2]<0.001
+		self.x[self.onGround,2] = 0.0
+		# update measurements
+		xu[:,0:self.n_states] = self.x
+		xdot = self.stateDerivative(0, xu)
+		self.R   = self.computeR(self.x[:,6:10]) # rotation matrices
+		self.acc = xdot[:,3:6] + self.g*self.R[:,:,2]  # add gravity in body frame
+		return self.x
+
+	#############################
+	### MEASUREMENT FUNCTIONS ###
+	#############################
+
+	def readAcc(self, Noise=0):
+		# accelerometer readings in m/s^2 -- np array Nx3
+		if Noise :
+			return self.acc + Noise * self.accNoise.draw()
+		return self.acc
+
+	def readGyro(self, Noise=0):
+		# gyro readings in rad/s -- np array Nx3
+		if Noise :
+			return self.x[:,10:13] + Noise * self.gyroNoise.draw()
+		return self.x[:,10:13]
+
+	def readZRanging(self, Noise=0):
+		# z ranging data readings -- np array N
+		# drones tilted past 90 degrees are flagged as crashed and read 0
+		z = self.x[:,2]
+		angle = np.abs(np.arccos(np.clip(self.R[:,2,2], -1, 1))) - (np.pi/180)*15/2 # alpha - theta_pz/2
+		angle = np.maximum(angle, 0)
+		self.crashed = self.crashed | ((angle>np.pi/2) & (z>=0))
+		ret = z/np.cos(angle)
+		if Noise :
+			nz  = self.expStdA * (1 + np.exp(self.expCoeff * (z - self.expPointA)))
+			ret = np.maximum(ret + Noise * nz * self.zNoise.draw(), 0)
+		# can read only positive distances from the floor
+		return np.where((z<0) | self.crashed, 0, ret)
+
+	def readPixelcount(self, Noise=0, Quantisation=True):
+		# optical flow pixelcounts in the x and y direction -- np array Nx2
+		dt      = 0.01 #technically the firmware uses a measured one
+		Npx     = 30
+		thetapx = 4.2*np.pi/180.0
+		R22     = self.R[:,2,2]
+		wFactor = 1.25
+		velBF   = self.x[:,3:6] #speed in body frame
+		h = np.where(self.x[:,2]>0.01, self.x[:,2], 0.01)
+		dn = np.empty((self.n,2))
+		dn[:,0] = (dt * Npx / thetapx) * ((velBF[:,0]*R22 / h) - wFactor * self.x[:,11])
+		dn[:,1] = (dt * Npx / thetapx) * ((velBF[:,1]*R22 / h) + wFactor * self.x[:,10])
+		if Noise :
+			dn = dn + Noise * self.flowNoise.draw()
+		if Quantisation:
+			return np.rint(dn)
+		return dn
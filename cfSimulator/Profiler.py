@@ -0,0 +1,149 @@
+# opt-in instrumentation of the simulation loop
+import cProfile
+import pstats
+import time
+import tracemalloc
+
+from .RealTime import stages
+
+'''
+	Profiler of cfSimulation: passed to run() or stream(), it times the
+	stages of each simulation step (reference, controller, physics, euler
+	angles, sensors and EKF) and counts their calls. Optionally the run is
+	also profiled function by function with cProfile and its memory
+	allocations are traced with tracemalloc. Several runs can be profiled
+	with the same object, their measurements add up
+'''
+class Profiler():
+
+	def __init__(self, cprofile=False, memory=False, top=15):
+		# cprofile : if true collects the time of every function with cProfile
+		# memory   : if true traces the memory allocations with tracemalloc
+		# top      : number of functions and allocation sites in the report
+		self.cprofile = cprofile
+		self.memory   = memory
+		self.top      = top
+		self.reset()
+
+	def reset(self):
+		self.wall       = 0.0 # time of the profiled runs [s]
+		self.steps      = 0
+		self.stageTimes = {s: {"calls": 0, "total": 0.0, "max": 0.0} for s in stages}
+		self.profile    = cProfile.Profile() if self.cprofile else None
+		self.snapshot   = None # tracemalloc snapshot at the end of the last run
+		self.peak       = 0    # peak of traced memory [bytes]
+
+	#############################
+	### CALLS OF THE SIM LOOP ###
+	#############################
+
+	def start(self, config):
+		# called by cfSimulation.advance before its first step
+		if self.memory:
+			tracemalloc.start()
+		if self.profile is not None:
+			self.profile.enable()
+		self.started = time.perf_counter()
+
+	def begin(self, t):
+		self.lapped = time.perf_counter()
+
+	def lap(self, stage):
+		now = time.perf_counter()
+		entry = self.stageTimes[stage]
+		entry["calls"] = entry["calls"]+1
+		entry["total"] = entry["total"]+now-self.lapped
+		if now-self.lapped>entry["max"]:
+			entry["max"] = now-self.lapped
+		self.lapped = now
+
+	def end(self):
+		self.steps = self.steps+1
+
+	def stop(self):
+		# called by cfSimulation.advance after its last step
+		self.wall = self.wall+time.perf_counter()-self.started
+		if self.profile is not None:
+			self.profile.disable()
+		if self.memory:
+			self.snapshot = tracemalloc.take_snapshot()
+			self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+			tracemalloc.stop()
+
+	###############
+	### RESULTS ###
+	###############
+
+	def stats(self):
+		# structured results of the profiled runs (times in seconds)
+		# output: dictionary with wall time, number of steps, for each stage its
+		#         calls, total, mean and max time and share of the wall time, the
+		#         time outside the stages ("other"), and optionally the top functions
+		#         by cumulative time ("functions") and allocation sites ("memory")
+		wall = max(self.wall, 1e-12)
+		result = {"wall": self.wall, "steps": self.steps, "stages": {}}
+		for stage, v in self.stageTimes.items():
+			result["stages"][stage] = {"calls": v["calls"], "total": v["total"], "max": v["max"],\
+			                           "mean": v["total"]/max(v["calls"], 1), "share": v["total"]/wall}
+		result["other"] = self.wall-sum(v["total"] for v in self.stageTimes.values())
+		if self.profile is not None:
+			result["functions"] = []
+			functions = pstats.Stats(self.profile).stats
+			for (file, line, name), (_, calls, tottime, cumtime, _) in \
+			    sorted(functions.items(), key=lambda f: f[1][3], reverse=True)[:self.top]:
+				result["functions"].append({"function": "%s:%d(%s)" % (file, line, name), "calls": calls,\
+				                            "tottime": tottime, "cumtime": cumtime})
+		if self.snapshot is not None:
+			result["memory"] = {"peak": self.peak, "top": []}
+			for stat in self.snapshot.statistics("lineno")[:self.top]:
+				frame = stat.traceback[0]
+				result["memory"]["top"].append({"site": "%s:%d" % (frame.filename, frame.lineno),\
+				                                "size": stat.size, "count": stat.count})
+		return result
+
+	def report(self):
+		# text summary of stats()
+		s = self.stats()
+		lines = ["%d steps in %.3f s (%.1f us per step)" % (s["steps"], s["wall"], 1e6*s["wall"]/max(s["steps"], 1))]
+		for stage, v in s["stages"].items():
+			lines.append("  %-10s %8d calls %8.3f s %5.1f%%  mean %6.1f us  max %8.1f us" %\
+			             (stage, v["calls"], v["total"], 100*v["share"], 1e6*v["mean"], 1e6*v["max"]))
+		lines.append("  %-10s %14s %8.3f s %5.1f%%" % ("other", "", s["other"], 100*s["other"]/max(s["wall"], 1e-12)))
+		if "functions" in s:
+			lines.append("functions by cumulative time:")
+			for f in s["functions"]:
+				lines.append("  %8d calls %8.3f s (own %8.3f s)  %s" % (f["calls"], f["cumtime"], f["tottime"], f["function"]))
+		if "memory" in s:
+			lines.append("memory: peak %.1f kB, largest allocation sites at the end of the run:" % (s["memory"]["peak"]/1024))
+			for m in s["memory"]["top"]:
+				lines.append("  %10.1f kB %8d blocks  %s" % (m["size"]/1024, m["count"], m["site"]))
+		return "\n".join(lines)
+
+'''
+	Several objects observing the simulation loop at the same time
+	(e.g., a RealTimeClock and a Profiler)
+'''
+class Probes():
+
+	def __init__(self, probes):
+		self.probes = probes
+
+	def start(self, config):
+		for p in self.probes:
+			p.start(config)
+
+	def begin(self, t):
+		for p in self.probes:
+			p.begin(t)
+
+	def lap(self, stage):
+		for p in self.probes:
+			p.lap(stage)
+
+	def end(self):
+		for p in self.probes:
+			p.end()
+
+	def stop(self):
+		for p in self.probes:
+			p.stop()
@@ -0,0 +1,136 @@
+# clock pacing a simulation to wall-clock time and measuring its loop latency
+import time
+import numpy as np
+
+stages    = ["reference", "controller", "physics", "euler", "sensors", "ekf"] # parts of a simulation step
+bin_width = 50e-6 # width of the bins of the histograms [s]
+n_bins    = 100   # the last bin also counts longer times
+
+'''
+	Soft real-time clock of cfSimulation: each step starts when the wall
+	clock reaches its simulated time (divided by speed) and has to be
+	computed before the next one is due. The clock records the latency of
+	each step and of its stages, the deadline misses (with the stage that
+	took longest in the missed steps) and the wake-up jitter.
+	A missed step does not make the following ones run back to back:
+	the schedule restarts from the end of the missed step, unless catch_up
+	is true. With pace=False the steps run as fast as possible and are only
+	measured against their deadlines
+'''
+class RealTimeClock():
+
+	def __init__(self, speed=1, pace=True, catch_up=False, spin=200e-6):
+		# speed    : multiple of real time (e.g., 2 runs the simulation twice as fast as the wall clock)
+		# pace     : if false the clock does not wait for the steps to be due
+		# catch_up : if true late steps keep their time of the schedule
+		# spin     : time before a deadline spent busy waiting instead of sleeping [s]
+		self.speed    = speed
+		self.pace     = pace
+		self.catch_up = catch_up
+		self.spin     = spin
+		self.reset()
+
+	def reset(self):
+		self.period     = None # wall time of a step [s], set by start()
+		self.anchor     = None # (wall time, simulated time) of the schedule
+		self.ticks      = 0
+		self.misses     = 0
+		self.latency    = {"total": 0.0, "max": 0.0, "hist": np.zeros(n_bins, dtype=int)}
+		self.jitter     = {"total": 0.0, "max": 0.0, "hist": np.zeros(n_bins, dtype=int)}
+		self.stageTimes = {s: {"total": 0.0, "max": 0.0, "hist": np.zeros(n_bins, dtype=int), "overruns": 0}\
+		                   for s in stages}
+
+	#############################
+	### CALLS OF THE SIM LOOP ###
+	#############################
+
+	def start(self, config):
+		# called by cfSimulation.advance before its first step
+		self.period = config.t_resolution/self.speed
+		self.anchor = None
+
+	def begin(self, t):
+		# waits until the step at simulated time t is due and starts measuring it
+		now = time.perf_counter()
+		if self.anchor is None:
+			self.anchor = (now, t)
+		due = self.anchor[0]+(t-self.anchor[1])/self.speed
+		if self.pace and now<due:
+			if due-now>self.spin:
+				time.sleep(due-now-self.spin)
+			while time.perf_counter()<due:
+				pass
+			now = time.perf_counter()
+		self.t        = t
+		self.due      = due
+		self.tickTime = {}
+		self.begun    = now
+		self.lapped   = now
+		accumulate(self.jitter, max(now-due, 0.0))
+
+	def lap(self, stage):
+		# closes the measurement of a stage of the current step
+		now = time.perf_counter()
+		self.tickTime[stage] = now-self.lapped
+		accumulate(self.stageTimes[stage], now-self.lapped)
+		self.lapped = now
+
+	def end(self):
+		# closes the measurement of the current step
+		now = time.perf_counter()
+		self.ticks = self.ticks+1
+		accumulate(self.latency, now-self.begun)
+		if now>self.due+self.period: # deadline missed
+			self.misses = self.misses+1
+			slowest = max(self.tickTime, key=self.tickTime.get)
+			self.stageTimes[slowest]["overruns"] = self.stageTimes[slowest]["overruns"]+1
+			if not(self.catch_up): # the next step is due now
+				self.anchor = (now, self.t+self.period*self.speed)
+
+	def stop(self):
+		# called by cfSimulation.advance after its last step
+		pass
+
+	###############
+	### RESULTS ###
+	###############
+
+	def stats(self):
+		# summary of the measured steps (times in seconds)
+		# output: dictionary with number of steps, deadline misses and their ratio,
+		#         mean and max of latency and jitter, and for each stage its mean
+		#         and max time and the number of missed steps in which it was the slowest
+		ticks = max(self.ticks, 1)
+		return {"ticks": self.ticks, "period": self.period, "misses": self.misses,\
+		        "miss_ratio": self.misses/ticks,\
+		        "latency_mean": self.latency["total"]/ticks, "latency_max": self.latency["max"],\
+		        "jitter_mean": self.jitter["total"]/ticks, "jitter_max": self.jitter["max"],\
+		        "stages": {s: {"mean": v["total"]/ticks, "max": v["max"], "overruns": v["overruns"]}\
+		                   for s, v in self.stageTimes.items()}}
+
+	def histogram(self, name="latency"):
+		# histogram of "latency", "jitter" or of the time of a stage
+		# output: bin edges [s] (the last bin is open) and counts
+		entry = self.stageTimes[name] if name in self.stageTimes else getattr(self, name)
+		return np.arange(n_bins+1)*bin_width, entry["hist"].copy()
+
+	def report(self):
+		# text summary of stats()
+		s = self.stats()
+		if s["period"] is None:
+			return "no steps measured"
+		lines = ["%d steps at %gx real time (deadline %.0f us): %d missed (%.2f%%)" %\
+		         (s["ticks"], self.speed, s["period"]*1e6, s["misses"], 100*s["miss_ratio"]),\
+		         "latency mean %.0f us, max %.0f us; jitter mean %.0f us, max %.0f us" %\
+		         (s["latency_mean"]*1e6, s["latency_max"]*1e6, s["jitter_mean"]*1e6, s["jitter_max"]*1e6)]
+		for stage, v in s["stages"].items():
+			lines.append("  %-10s mean %6.0f us  max %6.0f us  slowest in %d missed steps" %\
+			             (stage, v["mean"]*1e6, v["max"]*1e6, v["overruns"]))
+		return "\n".join(lines)
+
+def accumulate(entry, value):
+	# adds a measured time to total, maximum and histogram of an entry
+	entry["total"] = entry["total"]+value
+	if value>entry["max"]:
+		entry["max"] = value
+	entry["hist"][min(int(value/bin_width), n_bins-1)] += 1
@@ -0,0 +1,142 @@
+# selection and decimation of the signals recorded by cfSimulation.run
+import sys
+from dataclasses import dataclass
+import numpy as np
+
+from .utils.FlightDataHandler import FlightDataHandler
+
+# recordable signals: name -> (key of the stream chunks, rows of the chunk array, number of rows)
+# (the names are the attributes of FlightDataHandler, gyro is the angular rate state)
+signals = {"pos"        : ("x",          slice(0,3),   3),
+           "vel"        : ("x",          slice(3,6),   3),
+           "gyro"       : ("x",          slice(10,13), 3),
+           "eta"        : ("eta",        None,         3),
+           "u"          : ("u",          None,         4),
+           "acc"        : ("acc",        None,         3),
+           "px_count"   : ("px_count",   None,         2),
+           "set_pt"     : ("set_pt",     None,         3),
+           "z_range"    : ("z_range",    None,         None), # one value per step
+           "kal_err_fd" : ("kal_err_fd", None,         3),
+           "est_pos"    : ("x_est",      slice(0,3),   3),
+           "est_vel"    : ("x_est",      slice(3,6),   3),
+           "est_eta"    : ("x_est",      slice(6,9),   3)}
+
+'''
+	Signals recorded by a run and their rates. Examples:
+	 * RecordingSpec()                                   all signals at every step (default)
+	 * RecordingSpec(signals=["pos", "set_pt"], rate=100) position and reference at 100 Hz
+	 * RecordingSpec(signals={"pos": 100, "u": None})     position at 100 Hz, inputs at every step
+	 * RecordingSpec(summary=True)                        no trace, only the summary of the flight
+	 * RecordingSpec(dtype="float32")                     all signals packed in a float32 buffer
+	Rates are rounded to a divider of the simulation rate. Steps are kept
+	when their index is a multiple of the decimation, so that the samples
+	of continuations (snapshots) fall on the samples of the full flight
+'''
+@dataclass(frozen=True)
+class RecordingSpec():
+	signals : tuple = None  # names, or dictionary of names and rates [Hz] (None: all the signals)
+	rate    : float = None  # rate of the signals without their own [Hz] (None: every step)
+	summary : bool  = False # if true no trace is recorded
+	dtype   : str   = None  # if given, the traces are packed in one buffer of this type (FlightDataHandler.compact)
+
+	def __post_init__(self):
+		# the signals are stored as a tuple of (name, rate) pairs, so that the spec is hashable
+		if self.signals is None:
+			pairs = tuple((name, None) for name in signals)
+		elif isinstance(self.signals, dict):
+			pairs = tuple(self.signals.items())
+		else:
+			pairs = tuple(s if isinstance(s, tuple) else (s, None) for s in self.signals)
+		for name, rate in pairs:
+			if not(name in signals):
+				sys.exit("unknown signal: " + str(name))
+		object.__setattr__(self, "signals", pairs)
+
+	def decimation(self, mainRate):
+		# steps between two recorded samples of each signal
+		# output: dictionary name -> decimation, the decimation of the time (rate)
+		step = lambda rate: 1 if rate is None else max(1, round(mainRate/rate))
+		return {name: step(self.rate if rate is None else rate) for name, rate in self.signals}, step(self.rate)
+
+'''
+	Collects the chunks of a run (see cfSimulation.stream) keeping the signals
+	of a RecordingSpec, and accumulates the summary of the flight
+'''
+class Recorder():
+
+	def __init__(self, spec, first, n_steps, mainRate):
+		# input : spec: RecordingSpec (None for all the signals at every step)
+		#         first: index of the first step of the run, n_steps: number of steps
+		self.spec = RecordingSpec() if spec is None else spec
+		self.step = first
+		self.decimations, self.timeDecimation = self.spec.decimation(mainRate)
+		if self.spec.summary:
+			self.decimations = {}
+		# preallocated traces and times of each decimation
+		count = lambda k: len(range(first+(-first)%k, first+n_steps, k))
+		self.times  = {k: np.zeros(count(k)) for k in set(self.decimations.values()) | {self.timeDecimation}}
+		self.filled = {k: 0 for k in self.times}
+		self.traces = {}
+		for name, k in self.decimations.items():
+			rows = signals[name][2]
+			self.traces[name] = np.zeros(count(k) if rows is None else (rows, count(k)))
+		# summary
+		self.steps     = 0
+		self.t_first   = None
+		self.t_last    = None
+		self.track_sq  = 0.0
+		self.track_max = 0.0
+		self.est_sq    = 0.0
+		self.final_pos = None
+
+	def add(self, chunk):
+		# stores a chunk of consecutive steps
+		n = len(chunk["t"])
+		stored = {} # decimation -> (columns of the chunk, columns of the traces)
+		for k in self.times:
+			cols = slice((-self.step)%k, n, k) # steps multiple of k
+			f = self.filled[k]
+			stored[k] = (cols, slice(f, f+len(range(*cols.indices(n)))))
+			self.times[k][stored[k][1]] = chunk["t"][cols]
+			self.filled[k] = stored[k][1].stop
+		for name, k in self.decimations.items():
+			key, rows, _ = signals[name]
+			values = chunk[key] if rows is None else chunk[key][rows]
+			self.traces[name][...,stored[k][1]] = values[...,stored[k][0]]
+		self.step = self.step+n
+		if n==0:
+			return
+		# summary of the flight, with all the steps
+		track = np.sqrt(np.sum((chunk["x"][0:3]-chunk["set_pt"])**2, axis=0))
+		est   = np.sqrt(np.sum((chunk["x_est"][0:3]-chunk["x"][0:3])**2, axis=0))
+		self.steps     = self.steps+n
+		self.t_first   = float(chunk["t"][0]) if self.t_first is None else self.t_first
+		self.t_last    = float(chunk["t"][-1])
+		self.track_sq  = self.track_sq+np.sum(track**2)
+		self.track_max = max(self.track_max, np.max(track))
+		self.est_sq    = self.est_sq+np.sum(est**2)
+		self.final_pos = chunk["x"][0:3,-1].copy()
+
+	def summary(self):
+		# output: dictionary with number of steps, first and last time, rms and max
+		#         tracking error, rms estimation error and final position
+		steps = max(self.steps, 1)
+		return {"steps": self.steps, "t_first": self.t_first, "t_last": self.t_last,\
+		        "track_rms": float(np.sqrt(self.track_sq/steps)), "track_max": float(self.track_max),\
+		        "est_rms": float(np.sqrt(self.est_sq/steps)), "final_pos": self.final_pos}
+
+	def output(self, trajectoryType):
+		# FlightDataHandler with the recorded signals (None for the others), trimmed
+		# to the steps actually simulated (fewer if the run was aborted)
+		traces = {name: None for name in signals}
+		for name, k in self.decimations.items():
+			traces[name] = self.traces[name][...,:self.filled[k]]
+		t = None if self.spec.summary else self.times[self.timeDecimation][:self.filled[self.timeDecimation]]
+		times = None # time of each signal, only if they have different rates
+		if any(k!=self.timeDecimation for k in self.decimations.values()):
+			times = {name: self.times[k][:self.filled[k]] for name, k in self.decimations.items()}
+		output = FlightDataHandler()
+		output.storeSignals(trajectoryType, t, traces, times, self.summary())
+		if self.spec.dtype is not None:
+			output.compact(self.spec.dtype)
+		return output
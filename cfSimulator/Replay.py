@@ -0,0 +1,96 @@
+# class replaying the sensor data of a recorded flight through the state
+# estimator, without simulating physics and controller
+import numpy as np
+
+from .Physics import cfPhysics
+from .StateEstimator import rateDo
+from .StateEstimatorBatch import cfEKFBatch
+from .utils.FlightDataHandler import FlightDataHandler
+
+'''
+	Offline replay of the Kalman filter: the sensor readings stored in a
+	flight data trace are streamed through N filter configurations at once
+'''
+class cfReplay():
+
+	def __init__(self, data, g=None):
+		# data : FlightDataHandler object or location of a saved trace
+		# g    : gravity used by the filter (default: the one of cfPhysics)
+		if not(isinstance(data, FlightDataHandler)):
+			location = data
+			data = FlightDataHandler()
+			data.open(location, silent=True)
+		self.data = data
+		self.g = cfPhysics(do_not_reset_seed=True).g if g is None else g
+
+	def run(self, params=None, n=None, simConfig=None):
+		# params    : filter parameters as accepted by cfEKFBatch, scalars are shared
+		#             by all the configurations and arrays have one value per configuration
+		# n         : number of configurations (default: length of the parameter arrays)
+		# simConfig : SimulationConfig with the rates of the filter
+		# NOTE: the trace stores the gyroscope state and not its (noisy) readings,
+		#       replays are exact for flights recorded without measurement noise
+		params = {} if params is None else params
+		if n is None:
+			n = max([np.size(v) for v in params.values()], default=1)
+		est = cfEKFBatch(n, self.g, params, simConfig)
+
+		acc     = self.data.acc
+		gyro    = self.data.gyro
+		pxCount = self.data.px_count
+		zrange  = self.data.z_range
+		n_steps = self.data.trace_length
+
+		x_est  = np.zeros((n, 9, n_steps)) # states estimated by EKF [pos, vel, eta]
+		err_fd = np.zeros((n, 3, n_steps)) # kalman innovations [z, flow x, flow y]
+
+		# as in cfSimulation.run the estimator runs from the second step
+		for i in range(1, n_steps):
+			x_est[:,:,i], err_fd[:,:,i] = est.runEKF(np.broadcast_to(acc[:,i], (n,3)),\
+			                                         np.broadcast_to(gyro[:,i], (n,3)),\
+			                                         np.broadcast_to(pxCount[:,i], (n,2)),\
+			                                         np.full(n, zrange[i]))
+
+		return ReplayData(self.data, params, x_est, err_fd, est)
+
+'''
+	Estimates and innovations of the filter configurations of one replay
+'''
+class ReplayData():
+
+	def __init__(self, data, params, x_est, err_fd, est):
+		self.params     = params
+		self.time       = data.time
+		self.est_pos    = x_est[:,0:3,:] # Nx3xT
+		self.est_vel    = x_est[:,3:6,:]
+		self.est_eta    = x_est[:,6:9,:]
+		self.kal_err_fd = err_fd         # Nx3xT
+		# estimation errors with respect to the recorded states
+		self.pos_err = self.est_pos-data.pos
+		self.vel_err = self.est_vel-data.vel
+		self.eta_err = self.est_eta-data.eta
+		# steps at which the innovations are computed (filter tick is step-1)
+		ticks = np.arange(len(self.time))-1
+		self.zrangingSteps = np.array([i>=0 and rateDo(est.zrangingRate, i, est.mainRate) for i in ticks])
+		self.flowSteps     = np.array([i>=0 and rateDo(est.flowRate, i, est.mainRate) for i in ticks])
+
+	def innovations(self):
+		# innovations at the steps where the measurements are used
+		# output: z ranging -- NxTz, flow -- Nx2xTf
+		return self.kal_err_fd[:,0,self.zrangingSteps], self.kal_err_fd[:,1:3,self.flowSteps]
+
+	def innovationStats(self):
+		# mean, standard deviation and rms of the innovations of each configuration
+		# output: dictionary of Nx3 arrays, columns are [z, flow x, flow y]
+		z, flow = self.innovations()
+		stats = {}
+		for name, f in [("mean", np.mean), ("std", np.std), ("rms", lambda v, axis: np.sqrt(np.mean(v**2, axis=axis)))]:
+			stats[name] = np.concatenate((f(z, axis=1)[:,None], f(flow, axis=2)), axis=1)
+		return stats
+
+	def errorStats(self):
+		# rms of the estimation errors of each configuration
+		# output: dictionary of Nx3 arrays (position, velocity and euler angles)
+		return {"pos": np.sqrt(np.mean(self.pos_err**2, axis=2)),\
+		        "vel": np.sqrt(np.mean(self.vel_err**2, axis=2)),\
+		        "eta": np.sqrt(np.mean(self.eta_err**2, axis=2))}
@@ -1,99 +1,301 @@
+import copy
 import numpy as np
 from .Physics import cfPhysics
 from .Controller import cfPIDController
 from .StateEstimator import cfEKF
-from .utils.FlightDataHandler import FlightDataHandler
+from .Config import SimulationConfig
+from .Trim import hoverTrim
+from .Profiler import Probes
+from .Abort import abortCheck
+from .Recording import Recorder
 
 ### simulation parameters
+# default options of the runs that are not given a SimulationConfig
 t_init          = 0
 t_resolution    = 0.001
 noise           = 0      # if non-zero includes measurement noise with given gain
 useKalmanFilter = True   # if true the KF is used for feedback
 quantisation    = False  # if false removes quantisation from flow data
+trimHeight      = None   # if given, the run starts hovering at this height [m]
+integrator      = "RK45" # physics integration method: "RK45", "RK4" or "semi-implicit"
+kernel          = "reference" # physics state derivative implementation: "reference" or "cached"
+zoh             = False  # if true inputs held by the controller are integrated in one solver call
+forcesTable     = False  # if true PWM commands are mapped to forces with a precomputed table
+ekfAttitude     = "expm" # EKF attitude error rotation: "expm" or "rodrigues"
+ekfCovariance   = "joseph" # EKF covariance update of the measurements: "joseph", "rank1" or "sqrt"
 
+def currentConfig():
+	# SimulationConfig with the current values of the module variables
+	return SimulationConfig(t_init=t_init, t_resolution=t_resolution, noise=noise,\
+	                        useKalmanFilter=useKalmanFilter, quantisation=quantisation, trimHeight=trimHeight,\
+	                        integrator=integrator, kernel=kernel, zoh=zoh, forcesTable=forcesTable,\
+	                        ekfAttitude=ekfAttitude, ekfCovariance=ekfCovariance)
+
+'''
+	State of a simulation between two steps: physics, controller and
+	estimator objects, index of the next step and values of the previous
+	step used by the controller. The steps are on the time grid of the
+	run that created the state (t_init, t_final, n_steps)
+'''
+class SimulationState():
+
+	def __init__(self, physics, ctrl, est, config, t_final, n_steps):
+		self.physics = physics
+		self.ctrl    = ctrl
+		self.est     = est
+		self.config  = config
+		self.t_init  = config.t_init
+		self.t_final = t_final
+		self.n_steps = n_steps
+		self.step    = 0 # next step to simulate
+		self.abort   = None # (reason, value, time) if an abort criterion stopped the run
+		# values of the previous step
+		self.x_prev     = np.zeros(physics.n_states)
+		self.gyro_prev  = np.zeros(3)
+		self.x_est_prev = np.zeros(9)
+
+	@property
+	def time(self):
+		# time of the next step
+		return timeGrid(self.t_init, self.t_final, self.n_steps, self.step, self.step+1)[0]
+
+	def fork(self):
+		# independent copy of the state (including the random generators of the noise)
+		return copy.deepcopy(self)
 
 class cfSimulation():
 
 	def __init__(self):
 		pass
 
-	def run(self, ref, t_final, silence=False, do_not_reset_seed=False):
+	def run(self, ref, t_final, silence=False, do_not_reset_seed=False, seed=1, config=None, state=None, clock=None, profiler=None):
+		# seed  : seed of the measurement noise (an integer or a numpy
+		#         SeedSequence), ignored if do_not_reset_seed is true
+		# config: SimulationConfig of the run (default: module variables)
+		# state : SimulationState to continue from (seed and config are taken
+		#         from the state, that is not modified)
+		# clock : RealTimeClock pacing the steps to the wall clock and
+		#         measuring their latency (default: as fast as possible)
+		# profiler: Profiler timing the stages of the steps (default: none)
+		# output: FlightDataHandler with the data of the flight (from the
+		#         time of state, if given), collected from stream(); if an abort
+		#         criterion of the configuration trips, the data ends at that step
+		#         and abortReason, abortValue and abortTime tell why. The signals
+		#         recorded and their rates are set by config.recording
+		if state is None:
+			state = self.start(t_final, do_not_reset_seed, seed, config)
+		else:
+			state = state.fork()
+		n_steps = stepsUntil(state.config, t_final)-state.step
+
+		# signals kept by the run (config.recording)
+		recorder = Recorder(state.config.recording, state.step, n_steps, state.config.mainRate)
+		for chunk in self.advance(state, ref, t_final, silence, clock=clock, profiler=profiler):
+			recorder.add(chunk)
+
+		##############################################
+		# store data as object attributes of storage #
+		##############################################
+
+		if hasattr(ref,'trajectoryType'):
+			traj_type = ref.trajectoryType
+		else:
+			traj_type = "arbitrary"
+		output = recorder.output(traj_type)
+		if state.abort is not None:
+			output.abortReason, output.abortValue, output.abortTime = state.abort
 
-		n_steps         = int((t_final-t_init)/t_resolution)
+		# return simulation data
+		return output
+
+	def stream(self, ref, t_final, silence=False, do_not_reset_seed=False, seed=1, config=None, chunk_size=1000, clock=None, profiler=None):
+		# generator running the simulation and yielding its data in chunks of
+		# chunk_size consecutive steps (the last chunk can be shorter), so that
+		# the memory used does not depend on the duration of the flight
+		# inputs: same as run()
+		# output: for each chunk a dictionary of arrays with one column per step:
+		#         "t" (times), "x" (physical states), "u" (PWM inputs), "eta" (euler
+		#         angles), "acc", "gyro", "px_count", "z_range" (measurements),
+		#         "set_pt" (references), "x_est" (EKF states), "kal_err_fd" (innovations),
+		#         and "abort": None, or (reason, value, time) in the last chunk of
+		#         a run stopped by an abort criterion (the chunk ends at that step)
+		state = self.start(t_final, do_not_reset_seed, seed, config)
+		return self.advance(state, ref, t_final, silence, chunk_size, clock, profiler)
+
+	def snapshot(self, ref, t, t_final, silence=False, do_not_reset_seed=False, seed=1, config=None):
+		# simulates a run until time t and returns its state, to be continued
+		# (possibly several times, with different references) by run(..., state=...)
+		# t_final: end of the time grid, continuations until t_final follow
+		#          the same steps as a run from the start
+		state = self.start(t_final, do_not_reset_seed, seed, config)
+		for chunk in self.advance(state, ref, t, silence):
+			pass
+		return state
+
+	def start(self, t_final, do_not_reset_seed=False, seed=1, config=None):
+		# state before the first step of a run
+		if config is None:
+			config = currentConfig()
 
 		##########################################
 		# initialization of simulation variables #
 		##########################################
-		physics = cfPhysics(do_not_reset_seed=do_not_reset_seed)
+		physics = cfPhysics(seed=seed, do_not_reset_seed=do_not_reset_seed, simConfig=config)
 		ctrl    = cfPIDController(physics.config, physics.b,\
 		                          physics.I, physics.m, physics.g,\
-		                          physics.k, physics.l)
-		est     = cfEKF(physics.g)
-
-		# initialize storage variables
-		t       = np.linspace(t_init,t_final,n_steps)
-		u_store = np.zeros((physics.n_inputs, n_steps))
-		x_store = np.zeros((physics.n_states, n_steps))
-		acc     = np.zeros((3,n_steps)) # inertial measurement
-		gyro    = np.zeros((3,n_steps)) # inertial measurement
-		eta     = np.zeros((3,n_steps)) # euler angles
-		pxCount = np.zeros((2,n_steps)) # pixel count measurement
-		zrange  = np.zeros((n_steps))   # z ranging measurement
-		set_pt  = np.zeros((3,n_steps)) # setpoint fed to cf
-		err_fd  = np.zeros((3,n_steps)) # kalman innovation from flow measurements
-		x_est   = np.zeros((9,n_steps)) # state estimated by EKF [pos, vel, eta]
-
-		# initialize loop counter
-		i = 0
+		                          physics.k, physics.l, simConfig=config)
+		est     = cfEKF(physics.g, simConfig=config)
+		if config.trimHeight is not None: # start from the trimmed hover
+			trim = hoverTrim(physics, ctrl, est, config)
+			trim.apply(physics, ctrl, est, config.t_init)
+		return SimulationState(physics, ctrl, est, config, t_final, stepsUntil(config, t_final))
+
+	def advance(self, state, ref, until, silence=False, chunk_size=1000, clock=None, profiler=None):
+		# generator simulating from state (which is updated) to time until,
+		# yielding the data in chunks as stream() does (clock and profiler as in run())
+		n_steps = stepsUntil(state.config, until)
+		# objects observing the loop (None if there are none)
+		probe = clock if profiler is None else profiler if clock is None else Probes([clock, profiler])
+		if probe is not None:
+			probe.start(state.config)
+		try:
+			yield from self.loop(state, ref, n_steps, silence, chunk_size, probe)
+		finally:
+			if probe is not None:
+				probe.stop()
+
+	def loop(self, state, ref, n_steps, silence, chunk_size, probe):
+		# simulation loop of advance() until step n_steps
+		physics = state.physics
+		ctrl    = state.ctrl
+		est     = state.est
+		config  = state.config
+		abort   = abortCheck(config)
+		if state.abort is not None: # nothing to continue
+			return
 
 		###################
 		# simulation loop #
 		###################
-		x_store[:,i] = physics.simulate(t[i], u_store[:,i]) # run first physics iteration
-		i = i+1
-
-		while i<n_steps: # loop over time steps
-			if not(silence) and not(i%1000): # progress printout
-				print(" -- simulation at time " + str(t[i]))
-
-			set_pt[:,i] = ref.refGen(t[i]) # get reference
-			if useKalmanFilter :           # compute control action from estimated state
-				u_store[:,i] = ctrl.ctrlCompute(set_pt[:,i],\
-				                                x_est[0:3,i-1],\
-				                                x_est[3:6,i-1],\
-				                                x_est[6:9,i-1],\
-				                                gyro[:,i-1])
-			else:     # compute control action directly from physics
-				u_store[:,i] = ctrl.ctrlCompute(set_pt[:,i],\
-				                                x_store[0:3,i-1],\
-				                                x_store[3:6,i-1],\
-				                                physics.quaternionToEuler(x_store[6:10,i-1]),\
-				                                gyro[:,i-1])
-			x_store[:,i] = physics.simulate(t[i], u_store[:,i]) # simulate physics
-			
-			# store measurements
-			eta[:,i]     = physics.quaternionToEuler(x_store[6:10,i])
-			acc[:,i]     = physics.readAcc(noise)
-			gyro[:,i]    = physics.readGyro(noise)
-			pxCount[:,i] = physics.readPixelcount(noise, quantisation)
-			zrange[i]    = physics.readZRanging(noise)
-
-			# run state estimator
-			x_est[:,i], err_fd[:,i] = est.runEKF(acc[:,i],gyro[:,i],pxCount[:,i],zrange[i])
-
-			i=i+1 # increase counter
+		for first in range(state.step, n_steps, chunk_size): # loop over chunks
+			last = min(first+chunk_size, n_steps)
 
-		##############################################
-		# store data as object attributes of storage #
-		##############################################
+			# initialize storage variables of the chunk
+			t       = timeGrid(state.t_init, state.t_final, state.n_steps, first, last)
+			u_store = np.zeros((physics.n_inputs, last-first))
+			x_store = np.zeros((physics.n_states, last-first))
+			acc     = np.zeros((3,last-first)) # inertial measurement
+			gyro    = np.zeros((3,last-first)) # inertial measurement
+			eta     = np.zeros((3,last-first)) # euler angles
+			pxCount = np.zeros((2,last-first)) # pixel count measurement
+			zrange  = np.zeros((last-first))   # z ranging measurement
+			set_pt  = np.zeros((3,last-first)) # setpoint fed to cf
+			err_fd  = np.zeros((3,last-first)) # kalman innovation from flow measurements
+			x_est   = np.zeros((9,last-first)) # state estimated by EKF [pos, vel, eta]
 
-		output = FlightDataHandler()
-		if hasattr(ref,'trajectoryType'):
-			traj_type = ref.trajectoryType
-		else:
-			traj_type = "arbitrary"
-		output.store(traj_type, t, x_store, u_store, eta, \
-					 acc, pxCount, set_pt, zrange, err_fd, x_est)
+			# references of the chunk in one call, if the generator can evaluate
+			# a vector of times (the first step of a run has no reference)
+			vectorized = hasattr(ref, "refGenVector")
+			if vectorized:
+				set_pt[:,:] = ref.refGenVector(t)
+				if first==0:
+					set_pt[:,0] = 0
 
-		# return simulation data
-		return output
+			# values of the previous step
+			x_prev, gyro_prev, x_est_prev = state.x_prev, state.gyro_prev, state.x_est_prev
+
+			for j in range(last-first): # loop over time steps (i is the step, j its column)
+				i = first+j
+				if i==0 : # run first physics iteration
+					x_store[:,j] = physics.simulate(t[j], u_store[:,j])
+					x_prev, gyro_prev, x_est_prev = x_store[:,j], gyro[:,j], x_est[:,j]
+					continue
+
+				if not(silence) and not(i%1000): # progress printout
+					print(" -- simulation at time " + str(t[j]))
+
+				if probe is not None: # wait until the step is due (real-time clock)
+					probe.begin(t[j])
+
+				if not(vectorized):
+					set_pt[:,j] = ref.refGen(t[j]) # get reference
+				if probe is not None:
+					probe.lap("reference")
+				if config.useKalmanFilter :    # compute control action from estimated state
+					u_store[:,j] = ctrl.ctrlCompute(set_pt[:,j],\
+					                                x_est_prev[0:3],\
+					                                x_est_prev[3:6],\
+					                                x_est_prev[6:9],\
+					                                gyro_prev)
+				else:     # compute control action directly from physics
+					u_store[:,j] = ctrl.ctrlCompute(set_pt[:,j],\
+					                                x_prev[0:3],\
+					                                x_prev[3:6],\
+					                                physics.quaternionToEuler(x_prev[6:10]),\
+					                                gyro_prev)
+				if probe is not None:
+					probe.lap("controller")
+				if config.zoh : # ticks for which the controller will hold the same input
+					held = timeGrid(state.t_init, state.t_final, state.n_steps,\
+					                i+1, min(i+1+ctrl.heldTicks(), state.n_steps))
+				else :
+					held = ()
+				x_store[:,j] = physics.simulate(t[j], u_store[:,j], held) # simulate physics
+				if probe is not None:
+					probe.lap("physics")
+
+				# store measurements
+				eta[:,j]     = physics.quaternionToEuler(x_store[6:10,j])
+				if probe is not None:
+					probe.lap("euler")
+				acc[:,j]     = physics.readAcc(config.noise)
+				gyro[:,j]    = physics.readGyro(config.noise)
+				pxCount[:,j] = physics.readPixelcount(config.noise, config.quantisation)
+				zrange[j]    = physics.readZRanging(config.noise)
+				if probe is not None:
+					probe.lap("sensors")
+
+				# run state estimator
+				x_est[:,j], err_fd[:,j] = est.runEKF(acc[:,j],gyro[:,j],pxCount[:,j],zrange[j])
+				if probe is not None:
+					probe.lap("ekf")
+					probe.end()
+
+				if abort is not None: # stop a hopeless run
+					tripped = abort.check(t[j], x_store[:,j], u_store[:,j], eta[:,j], set_pt[:,j], x_est[:,j], est)
+					if tripped is not None:
+						state.abort = tripped+(float(t[j]),)
+						last = i+1
+						break
+
+				# values of the previous step used by the controller
+				x_prev, gyro_prev, x_est_prev = x_store[:,j], gyro[:,j], x_est[:,j]
+
+			# the state is consistent at the end of each chunk
+			state.step       = last
+			state.x_prev     = x_prev.copy()
+			state.gyro_prev  = gyro_prev.copy()
+			state.x_est_prev = x_est_prev.copy()
+
+			k = last-first # columns of the chunk (fewer if the run was aborted)
+			yield {"t": t[:k], "x": x_store[:,:k], "u": u_store[:,:k], "eta": eta[:,:k], "acc": acc[:,:k],\
+			       "gyro": gyro[:,:k], "px_count": pxCount[:,:k], "z_range": zrange[:k], "set_pt": set_pt[:,:k],\
+			       "x_est": x_est[:,:k], "kal_err_fd": err_fd[:,:k], "abort": state.abort}
+			if state.abort is not None:
+				return
+
+def stepsUntil(config, t):
+	# number of steps of a run until time t
+	return int((t-config.t_init)/config.t_resolution)
+
+def timeGrid(t_init, t_final, n_steps, first, last):
+	# times of the steps from first to last-1, equal to
+	# np.linspace(t_init,t_final,n_steps)[first:last] without building the whole grid
+	# (steps after the end of the grid continue with the same spacing)
+	t = np.arange(first, last, dtype=float)
+	if n_steps>1 :
+		t = t*((t_final-t_init)/(n_steps-1))
+	t = t+t_init
+	if n_steps>1 and first<n_steps<=last : # the grid ends exactly at t_final
+		t[n_steps-1-first] = t_final
+	return t
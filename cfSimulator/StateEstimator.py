@@ -2,6 +2,7 @@
 
 import numpy as np
 import math
+import sys
 import scipy.linalg as spl
 
 # synchronization macros
@@ -14,16 +15,52 @@ predDT = 1/predictionRate
 zrDT   = 1/zrangingRate
 flowDT = 1/flowRate
 
-def rateDo(rate, tick):
+def rateDo(rate, tick, main=mainRate):
     #utility function to trigger events at expected rate
-    return not(tick % (mainRate/rate))
+    return not(tick % (main/rate))
+
+# available computations of the attitude error rotation
+attitudeMethods = ["expm",      # scipy matrix exponential (reference)
+                   "rodrigues"] # closed form rotation, block-wise covariance updates
+# available covariance updates of the scalar measurements
+covarianceUpdates = ["joseph", # full Joseph form (reference)
+                     "rank1",  # in-place rank one update of P
+                     "sqrt"]   # square-root covariance P=SS' (Potter update)
 
 class cfEKF():
 
-    def __init__(self, g):
+    def __init__(self, g, attitudeMethod="expm", covarianceUpdate="joseph", simConfig=None):
+        # simConfig: SimulationConfig with the rates and the methods of the
+        #            filter (if given, it overrides the method arguments)
         # drone parameters
         self.g = g 
 
+        # synchronization
+        if simConfig is None:
+            self.mainRate, self.predictionRate = mainRate, predictionRate
+            self.zrangingRate, self.flowRate   = zrangingRate, flowRate
+        else:
+            self.mainRate       = simConfig.mainRate
+            self.predictionRate = simConfig.predictionRate
+            self.zrangingRate   = simConfig.zrangingRate
+            self.flowRate       = simConfig.flowRate
+            attitudeMethod      = simConfig.ekfAttitude
+            covarianceUpdate    = simConfig.ekfCovariance
+        self.mainDT = 1/self.mainRate
+        self.predDT = 1/self.predictionRate
+        self.flowDT = 1/self.flowRate
+
+        # computation of the attitude error rotation
+        if not(attitudeMethod in attitudeMethods):
+            sys.exit("unknown attitude method: " + str(attitudeMethod))
+        self.attitudeMethod = attitudeMethod
+        # linearised dynamics, constant blocks are set only once
+        self.A = np.identity(9)
+        # covariance update of the scalar measurements
+        if not(covarianceUpdate in covarianceUpdates):
+            sys.exit("unknown covariance update: " + str(covarianceUpdate))
+        self.covarianceUpdate = covarianceUpdate
+
         # filter params
         self.procNoiseAcc_xy = 0.5
         self.procNoiseAcc_z = 1.0
@@ -45,6 +82,7 @@ class cfEKF():
         self.q = np.array([1,0,0,0])
         self.R = np.identity(3)
         self.P = np.diag([100,100,1,0.01,0.01,0.01,0.01,0.01,0.01])  # covar matrix init
+        self.S = np.sqrt(self.P) # square root of P (used only by the "sqrt" update)
 
         self.stateExternal = np.zeros(9)
         self.flowerror = np.zeros(2)
@@ -74,13 +112,43 @@ class cfEKF():
                           [         2*(qx*qy+qw*qz),qw**2-qx**2+qy**2-qz**2,         2*(qy*qz-qw*qx)],\
                           [         2*(qx*qz-qw*qy),        2*(qy*qz+qw*qx),qw**2-qx**2-qy**2+qz**2]])
 
+    def clampDiagonalP(self):
+        # saturate the variances (symmetry is not affected)
+        np.fill_diagonal(self.P, np.minimum(np.maximum(np.diagonal(self.P),0),100))
+
     def sanityCheckP(self):
+        if self.covarianceUpdate=="sqrt" :
+            self.sanityCheckS()
+            return
         # saturate
-        for i in range(9):
-            self.P[i,i] = min(max(self.P[i,i],0),100)
+        self.clampDiagonalP()
         # enforce symmetry
         self.P = (self.P+self.P.transpose())/2
 
+    def sanityCheckS(self):
+        # saturate the variances of P=SS' (they cannot be negative) scaling
+        # the rows of S, so that P stays symmetric and positive semidefinite
+        var = np.einsum('ij,ij->i', self.S, self.S)
+        if np.any(var>100):
+            self.S = self.S*np.sqrt(100/np.maximum(var,100))[:,None]
+
+    def expCross(self, v):
+        # matrix exponential of the skew symmetric matrix of v
+        if self.attitudeMethod=="expm" :
+            return spl.expm(self.cross(v))
+        # closed form (Rodrigues formula):
+        # exp(K) = I + sin(a)/a K + (1-cos(a))/a^2 K^2, with a=|v|
+        a2 = v[0]*v[0]+v[1]*v[1]+v[2]*v[2]
+        if a2<1e-12 : # Taylor expansion of the coefficients
+            c1 = 1-a2/6
+            c2 = 0.5-a2/24
+        else :
+            a  = math.sqrt(a2)
+            c1 = math.sin(a)/a
+            c2 = (1-math.cos(a))/a2
+        K = self.cross(v)
+        return np.identity(3) + c1*K + c2*K.dot(K)
+
     def quatMult(self, dq, q):
         out = np.zeros(4)
         out[0] = dq[0]*q[0]-dq[1]*q[1]-dq[2]*q[2]-dq[3]*q[3]
@@ -105,18 +173,30 @@ class cfEKF():
         # use IMU data to predict state forward
 
         d = gyro*dt/2
-        # build A (linearised dynamics)
-        A = np.zeros((9,9))
-        A[0:3,0:3] = np.identity(3)
-        A[0:3,3:6] = self.R*dt
-        A[0:3,6:9] = np.matmul(self.R,self.cross(-self.x[3:6]))*dt
-        A[3:6,3:6] = np.identity(3)+self.cross(-gyro)*dt
-        A[3:6,6:9] = self.g*self.cross(-self.R[2,:])*dt
-        A[6:9,6:9] = spl.expm(self.cross(-d))
+        if self.attitudeMethod=="expm" :
+            # build A (linearised dynamics)
+            A = np.zeros((9,9))
+            A[0:3,0:3] = np.identity(3)
+            A[0:3,3:6] = self.R*dt
+            A[0:3,6:9] = np.matmul(self.R,self.cross(-self.x[3:6]))*dt
+            A[3:6,3:6] = np.identity(3)+self.cross(-gyro)*dt
+            A[3:6,6:9] = self.g*self.cross(-self.R[2,:])*dt
+            A[6:9,6:9] = spl.expm(self.cross(-d))
+        else :
+            # fill the non-constant blocks of A (linearised dynamics)
+            A = self.A
+            A[0:3,3:6] = self.R*dt
+            A[0:3,6:9] = np.matmul(self.R,self.cross(-self.x[3:6]))*dt
+            A[3:6,3:6] = np.identity(3)+self.cross(-gyro)*dt
+            A[3:6,6:9] = self.g*self.cross(-self.R[2,:])*dt
+            A[6:9,6:9] = self.expCross(-d)
 
         # covariance update according to system dynamics 
-        AP = np.matmul(A,self.P)             # compute A*P
-        self.P = np.matmul(AP,A.transpose()) # compute A*P*A'
+        if self.covarianceUpdate=="sqrt" :
+            self.S = np.matmul(A,self.S)         # A*S*(A*S)' = A*P*A'
+        else :
+            AP = np.matmul(A,self.P)             # compute A*P
+            self.P = np.matmul(AP,A.transpose()) # compute A*P*A'
 
         # prediction
         dt2 = pow(dt,2)
@@ -136,7 +216,7 @@ class cfEKF():
 
     def addProcessNoise(self, dt):
         # update covariance matrix according to process-noise
-        self.P = self.P + np.diag(np.power([self.procNoiseAcc_xy*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
+        Q = np.power([self.procNoiseAcc_xy*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
                                             self.procNoiseAcc_xy*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
                                             self.procNoiseAcc_z*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
                                             self.procNoiseAcc_xy*dt + self.procNoiseVel+self.velNoiseForSim_xy,\
@@ -144,22 +224,52 @@ class cfEKF():
                                             self.procNoiseAcc_z*dt + self.procNoiseVel,\
                                             self.measNoiseGyro_rollpitch * dt + self.procNoiseAtt,\
                                             self.measNoiseGyro_rollpitch * dt + self.procNoiseAtt,\
-                                            self.measNoiseGyro_yaw * dt + self.procNoiseAtt ],2))
+                                            self.measNoiseGyro_yaw * dt + self.procNoiseAtt ],2)
+        if self.covarianceUpdate=="sqrt" :
+            # S*S'+Q = [S sqrt(Q)]*[S sqrt(Q)]', triangularised with a QR decomposition
+            self.S = np.linalg.qr(np.hstack((self.S, np.diag(np.sqrt(Q)))).transpose(), mode='r').transpose()
+        else :
+            self.P = self.P + np.diag(Q)
         self.sanityCheckP()
 
     def scalarUpdate(self, error, H, std):
         # given the measurement Jacobian 'H' and the innovation 'error'
         # update state and covariance
         R      = pow(std,2)
+        if self.covarianceUpdate=="sqrt" :
+            self.potterUpdate(error, H, R)
+            return
         PHt    = self.P.dot(H)                 # no need to transpose in numpy
         HPHtR  = H.dot(PHt)+R                  # HPH'+R
         K      = PHt/HPHtR                     # kalman gain
         self.x = self.x+K*error                # measurement update
+        if self.covarianceUpdate=="rank1" :
+            # Joseph form expanded for a scalar measurement (P is symmetric, HP=PH'):
+            # (I-KH)P(I-KH)'+KRK' = P - KHP - PH'K' + (HPH'+R)KK'
+            # the terms are symmetric, but M and M' are not subtracted with the
+            # same roundings, so P is symmetrized as in the Joseph update
+            M = np.outer(K,PHt)
+            self.P -= M
+            self.P -= M.transpose()
+            self.P += HPHtR*np.outer(K,K)
+            self.sanityCheckP()
+            return
         IKH    = np.identity(9)-np.outer(K,H)  #
         IKHP   = np.matmul(IKH,self.P)
         self.P = np.matmul(IKHP,IKH.transpose())+np.outer(K,K)*R
         self.sanityCheckP()
 
+    def potterUpdate(self, error, H, R):
+        # scalar measurement update of the square root covariance S (P=SS')
+        phi    = self.S.transpose().dot(H)     # S'H'
+        a      = 1/(phi.dot(phi)+R)            # 1/(HPH'+R)
+        Sphi   = self.S.dot(phi)               # PH'
+        K      = a*Sphi                        # kalman gain
+        self.x = self.x+K*error                # measurement update
+        gamma  = a/(1+math.sqrt(a*R))
+        self.S = self.S-gamma*np.outer(Sphi,phi)
+        self.sanityCheckS()
+
     def correctionZranging(self, meas):
         # update estimate with Z laser ranging data
         pred = self.x[2]/self.R[2,2]
@@ -205,13 +315,25 @@ class cfEKF():
 
         # rotate covariance since we rotated body
         d = self.x[6:9]/2
-        # build A (linearised dynamics)
-        A = np.zeros((9,9))
-        A[0:3,0:3] = np.identity(3)
-        A[3:6,3:6] = np.identity(3)
-        A[6:9,6:9] = spl.expm(self.cross(-d))
-        AP = np.matmul(A,self.P)             # compute A*P
-        self.P = np.matmul(AP,A.transpose()) # compute A*P*A'
+        if self.attitudeMethod=="expm" :
+            # build A (linearised dynamics)
+            A = np.zeros((9,9))
+            A[0:3,0:3] = np.identity(3)
+            A[3:6,3:6] = np.identity(3)
+            A[6:9,6:9] = spl.expm(self.cross(-d))
+            if self.covarianceUpdate=="sqrt" :
+                self.S = np.matmul(A,self.S)         # A*S*(A*S)' = A*P*A'
+            else :
+                AP = np.matmul(A,self.P)             # compute A*P
+                self.P = np.matmul(AP,A.transpose()) # compute A*P*A'
+        elif self.covarianceUpdate=="sqrt" :
+            self.S[6:9,:] = np.matmul(self.expCross(-d),self.S[6:9,:])
+        else :
+            # A is the identity but for the attitude block E:
+            # only the attitude rows and columns of P change
+            E = self.expCross(-d)
+            self.P[6:9,:] = np.matmul(E,self.P[6:9,:])             # compute A*P
+            self.P[:,6:9] = np.matmul(self.P[:,6:9],E.transpose()) # compute A*P*A'
         self.sanityCheckP()
 
         self.updateR()
@@ -227,23 +349,25 @@ class cfEKF():
         # of all the timings of the kalman filter steps
         update = False
 
-        if rateDo(predictionRate, self.tick):
-            self.predictionStep(acc,gyro,predDT)
+        if rateDo(self.predictionRate, self.tick, self.mainRate):
+            self.predictionStep(acc,gyro,self.predDT)
             update = True
 
-        if rateDo(zrangingRate, self.tick):
+        if rateDo(self.zrangingRate, self.tick, self.mainRate):
             self.correctionZranging(zrange)
             update = True
 
-        if rateDo(flowRate, self.tick):
-            self.correctionFlow(pxCount,gyro,flowDT)
+        if rateDo(self.flowRate, self.tick, self.mainRate):
+            self.correctionFlow(pxCount,gyro,self.flowDT)
             update = True
 
         # call finalize state is update has been made
         if update:
             self.finalize()
 
-        self.addProcessNoise(mainDT)
+        self.addProcessNoise(self.mainDT)
+        if self.covarianceUpdate=="sqrt" :
+            self.P = np.matmul(self.S,self.S.transpose())
 
         self.tick = self.tick + 1 # increase counter
         return self.stateExternal, np.concatenate(([self.zerror],self.flowerror))
@@ -0,0 +1,276 @@
+"""
+vectorized extended Kalman filter of N independent drones.
+Implements the same filter of cfEKF, with states stored as an (N, 9)
+array, covariances as (N, 9, 9) and quaternions as (N, 4), so that
+every step of the filter runs once for the whole fleet
+"""
+
+import numpy as np
+import sys
+
+from .StateEstimator import cfEKF, rateDo
+
+# filter parameters that can differ from drone to drone
+filterParams = ["procNoiseAcc_xy", "procNoiseAcc_z", "procNoiseVel", "velNoiseForSim_xy",\
+                "procNoisePos", "procNoiseAtt", "measNoiseGyro_rollpitch", "measNoiseGyro_yaw",\
+                "expPointA", "expStdA", "expCoeff", "flowStd"]
+
+class cfEKFBatch():
+
+    def __init__(self, n, g, params=None, simConfig=None):
+        # n         : number of drones
+        # params    : filter parameters (names in filterParams), each value is
+        #             a scalar or an array with one value per drone (N);
+        #             parameters that are not given take the values of cfEKF
+        # simConfig : SimulationConfig with the rates of the filter
+        model  = cfEKF(g, simConfig=simConfig)
+        params = {} if params is None else params
+        for name in params:
+            if not(name in filterParams):
+                sys.exit("unknown filter parameter: " + str(name))
+
+        # drone parameters
+        self.n = n
+        self.g = g
+
+        # synchronization
+        self.mainRate       = model.mainRate
+        self.predictionRate = model.predictionRate
+        self.zrangingRate   = model.zrangingRate
+        self.flowRate       = model.flowRate
+        self.mainDT = model.mainDT
+        self.predDT = model.predDT
+        self.flowDT = model.flowDT
+
+        # filter params
+        for name in filterParams:
+            setattr(self, name, np.broadcast_to(np.asarray(params.get(name, getattr(model, name)), dtype=float), (n,)))
+
+        # linearised dynamics, constant blocks are set only once
+        self.A = np.tile(np.identity(9), (n,1,1))
+
+        # filter states
+        self.x = np.zeros((n,9))               # estimated states: position, speed, attitude error
+        self.q = np.tile(model.q, (n,1)).astype(float)
+        self.R = np.tile(model.R, (n,1,1))
+        self.P = np.tile(model.P, (n,1,1)).astype(float) # covar matrices init
+
+        self.stateExternal = np.zeros((n,9))
+        self.flowerror = np.zeros((n,2))
+        self.zerror = np.zeros(n)
+
+        self.tick = 0 # counter
+
+    #########################
+    ### UTILITY FUNCTIONS ###
+    #########################
+    def cross(self, x):
+        # utility function: compute skew symmetric matrices from 3-dim vectors
+        # input : vectors -- np array Nx3
+        # output: skew symmetric matrices -- np array Nx3x3
+        mcross = np.zeros((x.shape[0],3,3))
+        mcross[:,0,1] = -x[:,2]
+        mcross[:,0,2] =  x[:,1]
+        mcross[:,1,0] =  x[:,2]
+        mcross[:,1,2] = -x[:,0]
+        mcross[:,2,0] = -x[:,1]
+        mcross[:,2,1] =  x[:,0]
+        return mcross
+
+    def updateR(self):
+        # computes rotation matrices from quaternions q
+        qw = self.q[:,0]
+        qx = self.q[:,1]
+        qy = self.q[:,2]
+        qz = self.q[:,3]
+        self.R[:,0,0] = qw**2+qx**2-qy**2-qz**2
+        self.R[:,0,1] = 2*(qx*qy-qw*qz)
+        self.R[:,0,2] = 2*(qx*qz+qw*qy)
+        self.R[:,1,0] = 2*(qx*qy+qw*qz)
+        self.R[:,1,1] = qw**2-qx**2+qy**2-qz**2
+        self.R[:,1,2] = 2*(qy*qz-qw*qx)
+        self.R[:,2,0] = 2*(qx*qz-qw*qy)
+        self.R[:,2,1] = 2*(qy*qz+qw*qx)
+        self.R[:,2,2] = qw**2-qx**2-qy**2+qz**2
+
+    def sanityCheckP(self):
+        # saturate
+        d = np.arange(9)
+        self.P[:,d,d] = np.minimum(np.maximum(self.P[:,d,d],0),100)
+        # enforce symmetry
+        self.P = (self.P+self.P.transpose(0,2,1))/2
+
+    def expCross(self, v):
+        # matrix exponentials of the skew symmetric matrices of v (Rodrigues formula)
+        # input : vectors -- np array Nx3
+        # output: rotation matrices -- np array Nx3x3
+        a2    = np.sum(v*v, axis=1)
+        small = a2<1e-12 # Taylor expansion of the coefficients
+        a     = np.sqrt(np.where(small, 1, a2))
+        c1    = np.where(small, 1-a2/6,  np.sin(a)/a)
+        c2    = np.where(small, 0.5-a2/24, (1-np.cos(a))/np.where(small, 1, a2))
+        K     = self.cross(v)
+        return np.identity(3) + c1[:,None,None]*K + c2[:,None,None]*np.matmul(K,K)
+
+    def quatMult(self, dq, q):
+        out = np.empty((q.shape[0],4))
+        out[:,0] = dq[:,0]*q[:,0]-dq[:,1]*q[:,1]-dq[:,2]*q[:,2]-dq[:,3]*q[:,3]
+        out[:,1] = dq[:,1]*q[:,0]+dq[:,0]*q[:,1]+dq[:,3]*q[:,2]-dq[:,2]*q[:,3]
+        out[:,2] = dq[:,2]*q[:,0]-dq[:,3]*q[:,1]+dq[:,0]*q[:,2]+dq[:,1]*q[:,3]
+        out[:,3] = dq[:,3]*q[:,0]+dq[:,2]*q[:,1]-dq[:,1]*q[:,2]+dq[:,0]*q[:,3]
+        return out
+
+    def rotationQuaternion(self, v):
+        # quaternions of the rotations by the vectors v (axis times angle)
+        # input : vectors -- np array Nx3
+        # output: quaternions -- np array Nx4
+        angle = np.sqrt(np.sum(v*v, axis=1))
+        sa    = np.sin(angle/2)/np.where(angle==0, 1, angle)
+        return np.concatenate((np.cos(angle/2)[:,None], sa[:,None]*v), axis=1)
+
+    def quaternionToEuler(self, q):
+        #utility function to translate quaternions in Euler angles
+        phi   = np.arctan2(2*(q[:,0]*q[:,1] + q[:,2]*q[:,3]), 1-2*(q[:,1]**2+q[:,2]**2))
+        theta = np.arcsin(np.clip(2*(q[:,0]*q[:,2] - q[:,3]*q[:,1]), -1, 1))
+        psi   = np.arctan2(2*(q[:,0]*q[:,3] + q[:,1]*q[:,2]), 1-2*(q[:,2]**2+q[:,3]**2))
+        return np.stack((phi, theta, psi), axis=1)
+
+    ###########################
+    ### ALGORITHM FUNCTIONS ###
+    ###########################
+
+    def predictionStep(self, acc, gyro, dt):
+        # use IMU data (Nx3 arrays) to predict states forward
+
+        # fill the non-constant blocks of A (linearised dynamics)
+        d = gyro*dt/2
+        A = self.A
+        A[:,0:3,3:6] = self.R*dt
+        A[:,0:3,6:9] = np.matmul(self.R,self.cross(-self.x[:,3:6]))*dt
+        A[:,3:6,3:6] = np.identity(3)+self.cross(-gyro)*dt
+        A[:,3:6,6:9] = self.g*self.cross(-self.R[:,2,:])*dt
+        A[:,6:9,6:9] = self.expCross(-d)
+
+        # covariance update according to system dynamics
+        AP = np.matmul(A,self.P)                   # compute A*P
+        self.P = np.matmul(AP,A.transpose(0,2,1))  # compute A*P*A'
+
+        # prediction
+        dt2 = pow(dt,2)
+        v   = self.x[:,3:6]*dt+acc*(dt2/2)
+        self.x[:,0:3] = self.x[:,0:3]+np.einsum('nij,nj->ni', self.R, v)+np.array([0,0,-self.g*dt2/2])
+        self.x[:,3:6] = self.x[:,3:6]+dt*(acc-np.cross(gyro,self.x[:,3:6])-self.g*self.R[:,2,:])
+        self.q = self.quatMult(self.rotationQuaternion(gyro*dt),self.q) # rotation in quaternions
+        self.q = self.q/np.sqrt(np.sum(self.q**2, axis=1))[:,None]      # normalize
+
+    def addProcessNoise(self, dt):
+        # update covariance matrices according to process-noise
+        Q = np.stack([self.procNoiseAcc_xy*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
+                      self.procNoiseAcc_xy*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
+                      self.procNoiseAcc_z*dt*dt + self.procNoiseVel*dt + self.procNoisePos,\
+                      self.procNoiseAcc_xy*dt + self.procNoiseVel+self.velNoiseForSim_xy,\
+                      self.procNoiseAcc_xy*dt + self.procNoiseVel+self.velNoiseForSim_xy,\
+                      self.procNoiseAcc_z*dt + self.procNoiseVel,\
+                      self.measNoiseGyro_rollpitch * dt + self.procNoiseAtt,\
+                      self.measNoiseGyro_rollpitch * dt + self.procNoiseAtt,\
+                      self.measNoiseGyro_yaw * dt + self.procNoiseAtt], axis=1)
+        d = np.arange(9)
+        self.P[:,d,d] += np.power(Q,2)
+        self.sanityCheckP()
+
+    def scalarUpdate(self, error, H, std):
+        # given the measurement Jacobians 'H' (Nx9) and the innovations 'error' (N)
+        # update states and covariances
+        R      = pow(std,2)
+        PHt    = np.einsum('nij,nj->ni', self.P, H)      # P*H'
+        HPHtR  = np.einsum('ni,ni->n', H, PHt)+R         # HPH'+R
+        K      = PHt/HPHtR[:,None]                       # kalman gains
+        self.x = self.x+K*error[:,None]                  # measurement update
+        # Joseph form expanded for a scalar measurement (as the "rank1" update of cfEKF):
+        # (I-KH)P(I-KH)'+KRK' = P - KHP - PH'K' + (HPH'+R)KK'
+        M = K[:,:,None]*PHt[:,None,:]
+        self.P -= M
+        self.P -= M.transpose(0,2,1)
+        self.P += HPHtR[:,None,None]*K[:,:,None]*K[:,None,:]
+        self.sanityCheckP() # M and M' are not subtracted with the same roundings
+
+    def correctionZranging(self, meas):
+        # update estimates with Z laser ranging data (N)
+        pred = self.x[:,2]/self.R[:,2,2]
+        H    = np.zeros((self.n,9))
+        H[:,2] = 1/self.R[:,2,2]
+        std  = self.expStdA * (1 + np.exp(self.expCoeff * (self.x[:,2] - self.expPointA)))
+        self.scalarUpdate(meas-pred, H, std)
+        # externalize error
+        self.zerror = meas-pred
+
+    def correctionFlow(self, dpxl, gyro, dt):
+        # update estimates with flow data (Nx2) and gyroscopes (Nx3)
+        Npx     = 30.0            #
+        thetapx = 4.2*np.pi/180.0 #
+        wFactor = 1.25            #
+        coeff   = Npx*dt/thetapx
+        z       = np.where(self.x[:,2]>0.1, self.x[:,2], 0.1)
+        R22     = self.R[:,2,2]
+        # X direction
+        predicted_x = coeff*((self.x[:,3]*R22/z) - wFactor * gyro[:,1])
+        Hx = np.zeros((self.n,9))
+        Hx[:,2] = coeff*((R22*self.x[:,3])/(-z*z))
+        Hx[:,3] = coeff*R22/z
+        self.scalarUpdate(dpxl[:,0]-predicted_x, Hx, self.flowStd)
+        # Y direction
+        predicted_y = coeff*((self.x[:,4]*R22/z) + wFactor * gyro[:,0])
+        Hy = np.zeros((self.n,9))
+        Hy[:,2] = coeff*((R22*self.x[:,4])/(-z*z))
+        Hy[:,4] = coeff*R22/z
+        self.scalarUpdate(dpxl[:,1]-predicted_y, Hy, self.flowStd)
+        # externalize error
+        self.flowerror = np.stack((dpxl[:,0]-predicted_x, dpxl[:,1]-predicted_y), axis=1)
+
+    def finalize(self):
+        # update quaternions according to quaternion errors (from kalman states)
+        self.q = self.quatMult(self.rotationQuaternion(self.x[:,6:9]),self.q) # rotation in quaternions
+        self.q = self.q/np.sqrt(np.sum(self.q**2, axis=1))[:,None]           # normalize
+
+        # rotate covariances since we rotated bodies:
+        # A is the identity but for the attitude block E
+        E = self.expCross(-self.x[:,6:9]/2)
+        self.P[:,6:9,:] = np.matmul(E,self.P[:,6:9,:])                   # compute A*P
+        self.P[:,:,6:9] = np.matmul(self.P[:,:,6:9],E.transpose(0,2,1))  # compute A*P*A'
+        self.sanityCheckP()
+
+        self.updateR()
+        self.x[:,6:9] = 0 # reset attitude errors
+
+        # compute externalised states
+        self.stateExternal[:,0:3] = self.x[:,0:3] # positions
+        self.stateExternal[:,3:6] = np.einsum('nij,nj->ni', self.R, self.x[:,3:6]) # speeds in world frame
+        self.stateExternal[:,6:9] = self.quaternionToEuler(self.q)
+
+    def runEKF(self, acc, gyro, pxCount, zrange):
+        # main function called by main loop that takes care
+        # of all the timings of the kalman filter steps
+        # input : acc, gyro -- np arrays Nx3, pxCount -- Nx2, zrange -- N
+        # output: externalised states -- Nx9, innovations [z, flow x, flow y] -- Nx3
+        update = False
+
+        if rateDo(self.predictionRate, self.tick, self.mainRate):
+            self.predictionStep(acc,gyro,self.predDT)
+            update = True
+
+        if rateDo(self.zrangingRate, self.tick, self.mainRate):
+            self.correctionZranging(zrange)
+            update = True
+
+        if rateDo(self.flowRate, self.tick, self.mainRate):
+            self.correctionFlow(pxCount,gyro,self.flowDT)
+            update = True
+
+        # call finalize state is update has been made
+        if update:
+            self.finalize()
+
+        self.addProcessNoise(self.mainDT)
+
+        self.tick = self.tick + 1 # increase counter
+        return self.stateExternal, np.concatenate((self.zerror[:,None],self.flowerror), axis=1)
@@ -0,0 +1,84 @@
+# trimmed hover condition used as initial condition of the runs
+import copy
+import numpy as np
+import scipy.optimize as opt
+
+from .Controller import pid_gains
+
+# trim values computed for each parameter set
+cache = {}
+
+# options of SimulationConfig the trim depends on (physics, controller and
+# estimator settings, rates and hover height), the others are not part of its key
+trim_options = ["t_resolution", "trimHeight", "integrator", "kernel", "zoh", "forcesTable",\
+                "rate_attitude", "rate_position", "ekfAttitude", "ekfCovariance",\
+                "predictionRate", "zrangingRate", "flowRate"]
+
+# time the estimator runs on hover data to settle its covariance [s]
+# (as the hover at the start of the references, the yaw and horizontal
+# position variances are not observable and never converge)
+ekf_settle_time = 2
+
+'''
+	Steady hover at a given height: the physics is at rest in the air with
+	the rotors balancing gravity, the controller integrators hold the hover
+	thrust, and the estimator covariance is settled on the sensor readings
+	of the hover. The values are computed once for each set of parameters
+	and then copied in the objects of each run
+'''
+class HoverTrim():
+
+	def __init__(self, physics, ctrl, est, height):
+		# input : physics, ctrl, est: objects of a run before its first step
+		#         height: hover height [m]
+		self.height = height
+
+		# PWM (equal for the four motors) balancing gravity
+		self.pwm = opt.brentq(lambda pwm: physics.pwdToForcesMap(np.full(physics.n_inputs, pwm))[0]-physics.m*physics.g,\
+		                      0, 65535, xtol=1e-9)
+		Tbar = physics.pwdToForcesMap(np.full(physics.n_inputs, self.pwm))
+
+		# physics at rest in the air
+		self.x = np.zeros(physics.n_states)
+		self.x[2] = height
+		self.x[6] = 1
+		physics.x = self.x.copy()
+		physics.updateMeasurements(Tbar)
+		self.acc = physics.acc.copy()
+		self.R   = physics.R.copy()
+
+		# the vz integrator gives the hover thrust (thrust = 1000*ki*stateI + 36000)
+		self.vzI = (self.pwm-36000)/(1000*pid_gains["vel"][1][2])
+
+		# estimator covariance settled on the (noiseless) readings of the hover
+		acc      = physics.readAcc(0)
+		gyro     = physics.readGyro(0)
+		pxCount  = physics.readPixelcount(0, False)
+		zrange   = physics.readZRanging(0)
+		est.x[2] = height
+		for tick in range(int(ekf_settle_time*est.mainRate)):
+			est.runEKF(acc, gyro, pxCount, zrange)
+		self.P = est.P.copy()
+		self.S = est.S.copy()
+
+	def apply(self, physics, ctrl, est, t_init=0):
+		# sets the hover in the objects of a run before its first step
+		# (at time t_init, the physics does not simulate the time before)
+		physics.currentTime = t_init
+		physics.x   = self.x.copy()
+		physics.acc = self.acc.copy()
+		physics.R   = self.R.copy()
+		ctrl.velPID.stateI[2] = self.vzI
+		ctrl.T = self.pwm # output of the position loop before its first execution
+		est.x[2] = self.height
+		est.P = self.P.copy()
+		est.S = self.S.copy()
+		est.stateExternal[2] = self.height
+
+def hoverTrim(physics, ctrl, est, config):
+	# returns the trim of the run configuration, computing it only the
+	# first time (on copies of the objects passed, which are not changed)
+	key = (type(physics).__name__, physics.m, physics.g) + tuple(getattr(config, o) for o in trim_options)
+	if not(key in cache):
+		cache[key] = HoverTrim(copy.deepcopy(physics), copy.deepcopy(ctrl), copy.deepcopy(est), config.trimHeight)
+	return cache[key]
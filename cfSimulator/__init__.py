@@ -1,3 +1,12 @@
 from .Simulation import cfSimulation
 from .utils.FlightDataHandler import FlightDataHandler
 from .Physics import Integration_Failed, Drone_Crash
+from .PhysicsBatch import cfPhysicsBatch
+from .ControllerBatch import cfPIDControllerBatch
+from .StateEstimatorBatch import cfEKFBatch
+from .Replay import cfReplay
+from .Config import SimulationConfig
+from .Cache import RunCache
+from .RealTime import RealTimeClock
+from .Profiler import Profiler
+from .Recording import RecordingSpec
@@ -1,3 +1,4 @@
+import sys
 import time
 import pickle as pk
 import matplotlib.pyplot as plt
@@ -13,8 +14,14 @@ class FlightDataHandler:
     chosen_grid_linestyle = '--'
     chosen_grid_color = 'gray'
 
+    # traces of a flight, in the order of the compact buffer (except the
+    # time, which is kept in float64 so that long flights keep their step)
+    trace_names = ["time", "pos", "vel", "gyro", "eta", "u", "acc", "px_count", "set_pt",\
+                   "z_range", "kal_err_fd", "est_pos", "est_vel", "est_eta"]
+
     def __init__(self):
-        pass
+        self.buffer = None # compact representation of the traces (see compact())
+        self.layout = None
 
     # method called by the Simulation object to store the data
     # in the FlightDataHandler object before saving
@@ -39,6 +46,82 @@ class FlightDataHandler:
         self.est_eta    = x_est[6:9,:]
         # no need to retrieve trace length each time it is needed
         self.trace_length = len(self.time)
+        self.buffer       = None
+        self.layout       = None
+        # set by the simulation if an abort criterion stopped the run
+        self.abortReason  = None
+        self.abortValue   = None
+        self.abortTime    = None
+
+    # method called by the Simulation object to store the signals of a
+    # RecordingSpec (see cfSimulator/Recording.py): traces is a dictionary
+    # of the signals (None if not recorded), times the time of each signal
+    # if they have different rates, summary a dictionary of flight metrics
+    def storeSignals(self, trajectoryType, t, traces, times, summary):
+        self.test    = trajectoryType
+        self.time    = t
+        for name, trace in traces.items():
+            setattr(self, name, trace)
+        self.times   = times
+        self.summary = summary
+        self.trace_length = 0 if t is None else len(t)
+        self.buffer       = None
+        self.layout       = None
+        self.abortReason  = None
+        self.abortValue   = None
+        self.abortTime    = None
+
+    def signalTime(self, name):
+        # time of the samples of a signal
+        if getattr(self, "times", None) is None or name=="time":
+            return self.time
+        return self.times[name]
+
+    ######################
+    ### COMPACT TRACES ###
+    ######################
+
+    def compact(self, dtype=np.float32):
+        # packs the traces sampled at the times of self.time in one contiguous
+        # buffer with one row per component (e.g. float32 for logging, float64
+        # for analysis), the trace attributes become views of its rows; traces
+        # at other rates (see signalTime) are converted to dtype, the times
+        # are not converted
+        if self.time is None:
+            return
+        names = [name for name in self.trace_names if name!="time" and getattr(self, name) is not None and\
+                 np.array_equal(self.signalTime(name), self.time)]
+        rows  = [1 if np.ndim(getattr(self, name))==1 else np.shape(getattr(self, name))[0] for name in names]
+        buffer = np.empty((sum(rows), self.trace_length), dtype=dtype)
+        layout = {}
+        row = 0
+        for name, n in zip(names, rows):
+            buffer[row:row+n] = getattr(self, name)
+            layout[name] = (row, n, np.ndim(getattr(self, name))==1) # first row, rows, one dimensional
+            row = row+n
+        self.buffer = buffer
+        self.layout = layout
+        self.setViews()
+        for name in self.trace_names:
+            if not(name in layout) and name!="time" and getattr(self, name) is not None:
+                setattr(self, name, np.asarray(getattr(self, name), dtype=dtype))
+
+    def setViews(self):
+        # trace attributes as views of the rows of the compact buffer
+        for name, (row, n, vector) in self.layout.items():
+            setattr(self, name, self.buffer[row] if vector else self.buffer[row:row+n])
+
+    def __getstate__(self):
+        # compact traces are pickled only once, in the buffer
+        state = self.__dict__.copy()
+        for name in (getattr(self, "layout", None) or {}):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if getattr(self, "layout", None) is not None:
+            self.setViews()
 
     def save(self, name="no-name"):
         if name=="no-name" :
@@ -58,27 +141,26 @@ class FlightDataHandler:
         if not(silent):
             print('Read data from file: \033[4m' + self.data_location + '\033[0m')
         self.test         = data.test
-        self.time         = data.time
-        self.pos          = data.pos
-        self.vel          = data.vel
-        self.gyro         = data.gyro
-        self.eta          = data.eta
-        self.u            = data.u
-        self.acc          = data.acc
-        self.px_count     = data.px_count
-        self.set_pt       = data.set_pt
-        self.z_range      = data.z_range
-        self.kal_err_fd   = data.kal_err_fd
-        self.est_pos      = data.est_pos
-        self.est_vel      = data.est_vel
-        self.est_eta      = data.est_eta
+        for name in self.trace_names: # views of data.buffer if the traces are compact
+            setattr(self, name, getattr(data, name))
         self.trace_length = data.trace_length
+        self.buffer       = getattr(data, "buffer", None) # not in older files
+        self.layout       = getattr(data, "layout", None)
+        self.abortReason  = getattr(data, "abortReason", None)
+        self.abortValue   = getattr(data, "abortValue", None)
+        self.abortTime    = getattr(data, "abortTime", None)
+        self.times        = getattr(data, "times", None)
+        self.summary      = getattr(data, "summary", None)
 
     ###############################
     ### CSV GENERATION FUNCTION ###
     ###############################
 
     def save_csv(self, csv_location):
+        if self.time is None or getattr(self, "times", None) is not None or\
+           any(getattr(self, name) is None for name in ["pos", "vel", "gyro", "eta", "u", "acc", "px_count",\
+               "set_pt", "z_range", "kal_err_fd", "est_pos", "est_vel", "est_eta"]):
+            sys.exit("csv files need all the signals at the same rate")
 
         with open(csv_location, 'w') as f:
 
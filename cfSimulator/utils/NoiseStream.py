@@ -0,0 +1,36 @@
+import numpy as np
+
+'''
+    Stream of zero mean gaussian samples with standard deviation std,
+    drawn in large blocks from a dedicated numpy random generator
+'''
+class NoiseStream():
+    def __init__(self, seed, std=1.0, block_size=4096):
+        # seed can be an integer or a numpy SeedSequence
+        # std  gives the shape of each sample (scalar, vector, or array)
+        self.rng        = np.random.default_rng(seed)
+        self.std        = np.asarray(std, dtype=float)
+        self.block_size = block_size
+        self.refill()
+
+    def refill(self):
+        self.block = self.std * self.rng.standard_normal((self.block_size,)+self.std.shape)
+        self.index = 0
+
+    def draw(self):
+        # returns the next sample
+        if self.index==self.block_size :
+            self.refill()
+        out = self.block[self.index]
+        self.index = self.index+1
+        return out
+
+def noiseSeeds(campaign_seed, n):
+    # independent and reproducible seeds for n runs of a campaign
+    return np.random.SeedSequence(campaign_seed).spawn(n)
+
+def sensorSeeds(seed, n=4):
+    # seeds of the n sensor streams of a run, spawned from a fresh copy of
+    # the seed so that the SeedSequence passed in is not changed and the
+    # same seed always gives the same noise
+    return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size).spawn(n)
@@ -0,0 +1,71 @@
+import numpy as np
+from .lp2Filter import lp2Filter
+
+'''
+    Bank of independent PID controllers evaluated together.
+    Gains, integrator states, clamps and derivative filter states are
+    stored as arrays, each element behaving exactly as one PID object
+'''
+class PIDBank():
+    def __init__(self, kp, ki, kd, dt, lp_enable, lp_rate, lp_cutoff, Iclamp):
+        # every parameter is either a scalar or an array, all parameters
+        # are broadcast to the shape of the bank
+        kp, ki, kd, dt, lp_enable, lp_rate, lp_cutoff, Iclamp = \
+            np.broadcast_arrays(kp, ki, kd, dt, lp_enable, lp_rate, lp_cutoff, Iclamp)
+        self.shape = kp.shape
+        self.kp = kp.astype(float)
+        self.ki = ki.astype(float)
+        self.kd = kd.astype(float)
+        self.dt = dt.astype(float)
+        self.oldError = np.zeros(self.shape)
+        self.stateI   = np.zeros(self.shape)
+        self.Iclamp   = Iclamp.astype(float)
+        self.clamped  = self.Iclamp!=0
+        self.lp_enable = lp_enable.astype(bool)
+        # masks are applied only if they are not uniform
+        self.anyClamped = self.clamped.any()
+        self.allClamped = self.clamped.all()
+        self.anyFilter  = self.lp_enable.any()
+        self.allFilter  = self.lp_enable.all()
+        # filter coefficients, computed by lp2Filter for each enabled element
+        self.b0 = np.zeros(self.shape)
+        self.b1 = np.zeros(self.shape)
+        self.b2 = np.zeros(self.shape)
+        self.a1 = np.zeros(self.shape)
+        self.a2 = np.zeros(self.shape)
+        for i in zip(*np.nonzero(self.lp_enable)):
+            lpf = lp2Filter(lp_rate[i], lp_cutoff[i])
+            self.b0[i] = lpf.b0
+            self.b1[i] = lpf.b1
+            self.b2[i] = lpf.b2
+            self.a1[i] = lpf.a1
+            self.a2[i] = lpf.a2
+        # filter states
+        self.x1 = np.zeros(self.shape)
+        self.x2 = np.zeros(self.shape)
+
+    def run(self, ref, measure):
+        error = ref-measure
+        P = self.kp * error
+        D = self.kd*(error-self.oldError)/self.dt
+        # derivative filter (where enabled)
+        if self.anyFilter :
+            x0  = D    - self.x1*self.a1 - self.x2*self.a2
+            out = x0*self.b0 + self.x1*self.b1 + self.x2*self.b2
+            if self.allFilter :
+                D = out
+                self.x2 = self.x1
+                self.x1 = x0
+            else :
+                D = np.where(self.lp_enable, out, D)
+                self.x2 = np.where(self.lp_enable, self.x1, 0)
+                self.x1 = np.where(self.lp_enable, x0, 0)
+        # integral action (clamped where Iclamp is not zero)
+        self.stateI = self.stateI + error * self.dt
+        if self.allClamped :
+            self.stateI = np.minimum(np.maximum(self.stateI, -self.Iclamp), self.Iclamp)
+        elif self.anyClamped :
+            self.stateI = np.where(self.clamped, np.minimum(np.maximum(self.stateI, -self.Iclamp), self.Iclamp), self.stateI)
+        I = self.ki * self.stateI
+        self.oldError = error
+        return P+D+I
@@ -1,3 +1,5 @@
 from .FlightDataHandler import FlightDataHandler
 from .lp2Filter import lp2Filter
 from .PID import PID
+from .PIDBank import PIDBank
+from .NoiseStream import NoiseStream, noiseSeeds, sensorSeeds
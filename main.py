@@ -1,10 +1,11 @@
 import time
 
-from cfSimulator import cfSimulation
+from cfSimulator import cfSimulation, Profiler
 from testCases.referenceGen import Reference
 
 reference = "step" # type of reference sequence
 duration  = 15     # duration of flight
+profile   = False  # if true prints the time spent in each stage of the simulation steps
 
 if __name__ == "__main__":
 
@@ -13,10 +14,13 @@ if __name__ == "__main__":
 	ref = Reference(reference)
 
 	# actual test execution
+	profiler = Profiler() if profile else None
 	start_test = time.perf_counter()
-	storeObj = sim.run(ref, duration)
+	storeObj = sim.run(ref, duration, profiler=profiler)
 	end_test = time.perf_counter()
 	print("This test took " + str(end_test-start_test) + " seconds")
+	if profile:
+		print(profiler.report())
 
 	# store simulation results
 	storeObj.save()
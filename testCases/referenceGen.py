@@ -1,4 +1,6 @@
+import sys
 import numpy as np
+import scipy.interpolate as interp
 
 hovering_height = 0.5
 size = 0.2
@@ -33,3 +35,74 @@ class Reference():
             return np.array([np.cos(0.8*t),np.sin(0.8*t),hovering_height])
         elif (self.trajectoryType == "spiral") :
             return np.array([0.01*t*np.cos(1.2*t),0.01*t*np.sin(1.2*t),hovering_height])
+
+    def refGenVector(self, t):
+        # references at all the times of the array t in one call,
+        # column i is refGen(t[i])
+        t   = np.asarray(t, dtype=float)
+        ref = np.zeros((3, len(t)))
+        ref[2] = hovering_height
+        fly = t>=2 # start by hovering
+        tf  = t[fly]
+        if   (self.trajectoryType == "step") :
+            ref[0, fly & (t<6)] = size
+            ref[1, t>=6]        = size
+        elif (self.trajectoryType == "zsinus") :
+            ref[2, fly] = size*np.sin(omega*tf)+hovering_height
+        elif (self.trajectoryType == "zramp") :
+            ref[2, fly] = size*tf+hovering_height
+        elif (self.trajectoryType == "xsinus") :
+            ref[0, fly] = np.sin(0.3*tf)
+        elif (self.trajectoryType == "ysinus") :
+            ref[1, fly] = np.sin(0.3*tf)
+        elif (self.trajectoryType == "circle") :
+            ref[0, fly] = np.cos(0.8*tf)
+            ref[1, fly] = np.sin(0.8*tf)
+        elif (self.trajectoryType == "spiral") :
+            ref[0, fly] = 0.01*tf*np.cos(1.2*tf)
+            ref[1, fly] = 0.01*tf*np.sin(1.2*tf)
+        elif np.any(fly) :
+            sys.exit("unknown reference type: " + str(self.trajectoryType))
+        return ref
+
+# available interpolations of the waypoints: spline degree and
+# derivatives set to zero at the first and last waypoint
+splines = {"cubic"   : (3, [1]),        # zero velocity
+           "minsnap" : (7, [1, 2, 3])}  # minimum snap: zero velocity, acceleration and jerk
+
+class WaypointReference():
+
+    def __init__(self, waypoints, times=None, speed=0.5, method="minsnap", trajectoryType="waypoints"):
+        # waypoints: Nx3 array of positions, or name of a text file with one
+        #            waypoint per line, as "x y z" or "t x y z" (commas allowed)
+        # times    : time of each waypoint (default: from the file, or covering
+        #            the straight segments at speed [m/s] starting at t=0)
+        # method   : "cubic" spline or "minsnap" (minimum snap polynomials, the
+        #            degree 7 spline continuous up to the 6th derivative)
+        # before the first and after the last waypoint the reference holds it
+        if isinstance(waypoints, str):
+            table = np.loadtxt(waypoints, delimiter="," if waypoints.endswith(".csv") else None, ndmin=2)
+            if table.shape[1]==4 :
+                times, waypoints = table[:,0], table[:,1:4]
+            else :
+                waypoints = table
+        waypoints = np.asarray(waypoints, dtype=float)
+        if times is None:
+            times = np.concatenate(([0], np.cumsum(np.linalg.norm(np.diff(waypoints, axis=0), axis=1)/speed)))
+        if not(method in splines):
+            sys.exit("unknown interpolation method: " + str(method))
+        self.trajectoryType = trajectoryType
+        self.waypoints = waypoints
+        self.times     = np.asarray(times, dtype=float)
+        # interpolation computed once
+        degree, zero = splines[method]
+        bc = [(d, np.zeros(3)) for d in zero]
+        self.spline = interp.make_interp_spline(self.times, self.waypoints, k=degree, bc_type=(bc, bc))
+
+    def refGen(self, t):
+        return self.refGenVector(np.array([t]))[:,0]
+
+    def refGenVector(self, t):
+        # references at all the times of the array t in one call
+        t = np.clip(np.asarray(t, dtype=float), self.times[0], self.times[-1])
+        return self.spline(t).T
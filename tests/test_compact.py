@@ -0,0 +1,16 @@
+# compact traces keep the time in float64
+import numpy as np
+
+from cfSimulator.utils import FlightDataHandler
+
+def test_compact_keeps_time_of_long_flights():
+	n = 1000
+	t = 3600+0.001*np.arange(n)
+	data = FlightDataHandler()
+	data.store("step", t, np.zeros((13,n)), np.zeros((4,n)), np.zeros((3,n)), np.zeros((3,n)), np.zeros((2,n)),\
+	           np.zeros((3,n)), np.zeros(n), np.zeros((3,n)), np.zeros((9,n)))
+	data.compact(np.float32)
+	assert data.buffer.dtype == np.float32 and data.pos.dtype == np.float32
+	assert data.time.dtype == np.float64
+	assert np.array_equal(data.time, t)
+	assert np.allclose(np.diff(data.time), 0.001)
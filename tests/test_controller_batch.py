@@ -0,0 +1,21 @@
+# the batched controller gives, for each drone, the PWM of cfPIDController
+import numpy as np
+
+from cfSimulator import cfPIDControllerBatch, SimulationConfig
+from cfSimulator.Controller import cfPIDController
+from cfSimulator.Physics import cfPhysics
+
+def controllers(n, simConfig=None):
+	physics = cfPhysics()
+	args = (physics.config, physics.b, physics.I, physics.m, physics.g, physics.k, physics.l)
+	return cfPIDControllerBatch(n, *args, simConfig=simConfig), cfPIDController(*args, simConfig=simConfig)
+
+def test_batch_step_matches_single_controller():
+	for simConfig in [None, SimulationConfig(rate_position=50)]:
+		batch, single = controllers(3, simConfig)
+		ref, pos, vel = np.array([0.1, 0, 0.5]), np.array([0, 0.02, 0.4]), np.array([0.01, 0, 0.1])
+		eta, gyro = np.array([0.01, -0.02, 0.005]), np.array([0.1, 0, -0.1])
+		pwm = batch.ctrlCompute(*[np.tile(v, (3,1)) for v in [ref, pos, vel, eta, gyro]])
+		assert pwm.shape == (3,4)
+		assert np.allclose(pwm, single.ctrlCompute(ref, pos, vel, eta, gyro))
+		assert batch.rate_position == single.rate_position
@@ -0,0 +1,12 @@
+# the covariance updates of the estimator keep P symmetric
+import numpy as np
+
+from cfSimulator.StateEstimator import cfEKF
+
+def test_rank1_update_keeps_p_symmetric():
+	est = cfEKF(9.81, covarianceUpdate="rank1")
+	rng = np.random.default_rng(0)
+	for _ in range(200):
+		est.scalarUpdate(0.1, rng.standard_normal(9), 0.5)
+		est.addProcessNoise(0.001)
+	assert np.array_equal(est.P, est.P.transpose())
@@ -0,0 +1,30 @@
+# the same seed always gives the same measurement noise
+import numpy as np
+
+from cfSimulator.Physics import cfPhysics
+from cfSimulator.PhysicsBatch import cfPhysicsBatch
+from cfSimulator.Cache import RunCache
+from cfSimulator.utils import noiseSeeds
+from testCases.referenceGen import Reference
+
+def test_seed_sequence_is_not_changed():
+	seed = noiseSeeds(7, 2)[0]
+	first, second = cfPhysics(seed=seed), cfPhysics(seed=seed)
+	assert seed.n_children_spawned == 0
+	assert np.array_equal(first.readAcc(1), second.readAcc(1))
+	assert np.array_equal(first.readGyro(1), second.readGyro(1))
+
+def test_seed_sequence_is_not_changed_batch():
+	seed = noiseSeeds(7, 2)[1]
+	first, second = cfPhysicsBatch(2, seed=seed), cfPhysicsBatch(2, seed=seed)
+	assert seed.n_children_spawned == 0
+	assert np.array_equal(first.accNoise.draw(), second.accNoise.draw())
+
+def test_cache_key_of_seed_sequence(tmp_path):
+	# a seed that has already spawned children gives the same noise, and so the same key
+	cache = RunCache(str(tmp_path))
+	seed, used = noiseSeeds(7, 2)[0], noiseSeeds(7, 2)[0]
+	used.spawn(3)
+	assert cache.key(Reference("step"), 1, seed) == cache.key(Reference("step"), 1, used)
+	assert np.array_equal(cfPhysics(seed=seed).readAcc(1), cfPhysics(seed=used).readAcc(1))
+	assert cache.key(Reference("step"), 1, seed) != cache.key(Reference("step"), 1, noiseSeeds(7, 2)[1])
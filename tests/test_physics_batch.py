@@ -0,0 +1,42 @@
+# a drone whose RK45 integration fails does not stop the rest of the fleet
+import numpy as np
+
+from cfSimulator.PhysicsBatch import cfPhysicsBatch
+
+class DivergentBatch(cfPhysicsBatch):
+	# the dynamics of the drones above 5 m stop being finite after 2 ms
+	def stateDerivative(self, t, xu, onGround=None):
+		xdot = super().stateDerivative(t, xu, onGround)
+		if t>0.002:
+			xdot[xu[:,2]>5] = np.nan
+		return xdot
+
+def test_rk45_failure_masks_only_the_divergent_drone():
+	fleet = DivergentBatch(3, integrator="RK45")
+	fleet.x[:,2] = [1, 10, 1]
+	alone = cfPhysicsBatch(1, integrator="RK45")
+	alone.x[:,2] = 1
+	u = np.full((3,4), 45000.0)
+	fleet.simulate(0.01, u)
+	alone.simulate(0.01, u[0:1])
+	assert list(fleet.failed) == [False, True, False]
+	assert np.isfinite(fleet.x).all()
+	assert np.allclose(fleet.x[[0,2]], alone.x)
+	# the frozen drone is not integrated in the following steps
+	frozen = fleet.x[1].copy()
+	for t in [0.02, 0.03, 0.04]:
+		fleet.simulate(t, u)
+		alone.simulate(t, u[0:1])
+	assert list(fleet.failed) == [False, True, False]
+	assert np.array_equal(fleet.x[1], frozen)
+	assert np.allclose(fleet.x[[0,2]], alone.x)
+
+def test_fixed_step_integrators_skip_frozen_drones():
+	for integrator in ["RK4", "semi-implicit"]:
+		fleet = cfPhysicsBatch(2, integrator=integrator)
+		fleet.x[:,2] = 1
+		fleet.crashed[0] = True
+		frozen = fleet.x[0].copy()
+		fleet.simulate(0.01, np.full((2,4), 45000.0))
+		assert np.array_equal(fleet.x[0], frozen)
+		assert not(np.array_equal(fleet.x[1], frozen))
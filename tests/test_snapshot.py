@@ -0,0 +1,15 @@
+# a run continued from a snapshot is the same as the run from the start
+import numpy as np
+
+from cfSimulator import cfSimulation, SimulationConfig
+from testCases.referenceGen import Reference
+
+def test_continuation_with_held_inputs():
+	# the snapshot falls inside an interval in which the controller holds its input
+	config = SimulationConfig(noise=1, zoh=True)
+	sim = cfSimulation()
+	full = sim.run(Reference("step"), 0.5, silence=True, config=config)
+	state = sim.snapshot(Reference("step"), 0.2513, 0.5, silence=True, config=config)
+	fork = sim.run(Reference("step"), 0.5, silence=True, config=config, state=state)
+	assert np.array_equal(fork.pos, full.pos[:,state.step:])
+	assert np.array_equal(fork.u, full.u[:,state.step:])
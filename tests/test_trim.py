@@ -0,0 +1,16 @@
+# the hover trim is computed once for the options it depends on
+import numpy as np
+
+from cfSimulator import cfSimulation, SimulationConfig
+from cfSimulator import Trim
+
+def test_trim_key_ignores_other_options():
+	Trim.cache.clear()
+	sim = cfSimulation()
+	first = sim.start(1, config=SimulationConfig(trimHeight=0.5))
+	other = sim.start(1, config=SimulationConfig(trimHeight=0.5, noise=1, quantisation=True, t_init=2))
+	assert len(Trim.cache) == 1
+	assert np.array_equal(first.physics.x, other.physics.x)
+	assert np.array_equal(first.est.P, other.est.P)
+	sim.start(1, config=SimulationConfig(trimHeight=0.5, rate_position=50))
+	assert len(Trim.cache) == 2